@@ -0,0 +1,73 @@
+"""
+Benchmark for Style="Change" computation
+
+Compares the previous iterrows / df.at loop with change_styles.apply_style on
+synthetic DAILY frames of a growing number of columns.
+
+    python bench/bench_change_style.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "../src"))
+
+from change_styles import apply_style  # noqa: E402
+
+
+def legacy_change(df):
+    df = df.copy()
+    dfc = df.copy()
+    lastindex = None
+    for index, row in df.iterrows():
+        if lastindex:
+            for i in row.index:
+                df.at[index, i] = dfc.at[index, i] - dfc.at[lastindex, i]
+        lastindex = index
+    return df
+
+
+def frame(days, columns):
+    index = pd.date_range("2024-01-01", periods=days).strftime("%Y-%m-%d")
+    data = np.random.default_rng(0).random((days, columns)) * 100
+    return pd.DataFrame(
+        data, index=index, columns=["group-{}".format(i) for i in range(columns)]
+    )
+
+
+def main(days=30):
+    print(
+        "{:>8} {:>12} {:>12} {:>12}".format(
+            "columns", "legacy s", "vector s", "x faster"
+        )
+    )
+    for columns in (10, 100, 1000):
+        df = frame(days, columns)
+        pd.testing.assert_frame_equal(legacy_change(df), apply_style(df, "Change"))
+        legacy = min(timeit.repeat(lambda: legacy_change(df), number=1, repeat=3))
+        vector = min(
+            timeit.repeat(lambda: apply_style(df, "Change"), number=1, repeat=3)
+        )
+        print(
+            "{:>8} {:>12.4f} {:>12.4f} {:>12.0f}".format(
+                columns, legacy, vector, legacy / vector
+            )
+        )
+    df = frame(365, 10000)
+    for style in (
+        "Change",
+        "PercentChange",
+        "RollingChange",
+        "WeekOverWeek",
+        "MonthOverMonth",
+    ):
+        seconds = min(timeit.repeat(lambda: apply_style(df, style), number=1, repeat=3))
+        print("{:>16} 365x10000 {:.4f}s".format(style, seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark for Lambda cold start imports
+
+Starts a fresh interpreter per feature set, the way a cold Lambda container
+does, and reports the wall time until the handler is ready, the import time
+reported by -X importtime and which optional dependencies got loaded.
+
+    python bench/bench_cold_start.py
+"""
+
+import os
+import re
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../src")
+
+HANDLER = (
+    "import importlib; "
+    "handler = importlib.import_module('lambda'); "
+    "from cost_explorer_report import CostExplorer; "
+    "CostExplorer()"
+)
+
+# Each feature set is what main_handler loads for that configuration
+FEATURES = {
+    "handler": HANDLER,
+    "per_dog": HANDLER + "; import rds_access",
+    "excel": HANDLER + "; import excel_writer",
+    "email": HANDLER + "; import delivery; delivery.build_message('a', 'b', link='c')",
+    "parquet": HANDLER + "; import exporters, pyarrow.parquet",
+}
+
+OPTIONAL = ("psycopg2", "xlsxwriter", "email.mime.multipart", "pyarrow.parquet")
+
+
+def cold_start(code):
+    env = dict(os.environ, AWS_DEFAULT_REGION="us-east-1", PYTHONDONTWRITEBYTECODE="1")
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=SRC,
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    seconds = time.perf_counter() - start
+    if process.returncode:
+        return None
+    imported = {}
+    for line in process.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            imported[match.group(3)] = (len(match.group(2)), int(match.group(1)))
+    # Top level imports only, nested ones are included in their parent
+    import_us = sum(us for depth, us in imported.values() if depth == 1)
+    loaded = [name for name in OPTIONAL if name in imported]
+    return seconds, import_us / 1e6, loaded
+
+
+def main(repeat=3):
+    print("{:>8} {:>9} {:>9}  {}".format("features", "start s", "import s", "loaded"))
+    for feature, code in FEATURES.items():
+        runs = [cold_start(code) for _ in range(repeat)]
+        if None in runs:
+            print("{:>8} {:>9}".format(feature, "failed"))
+            continue
+        seconds, import_s, loaded = min(runs)
+        print(
+            "{:>8} {:>9.3f} {:>9.3f}  {}".format(
+                feature, seconds, import_s, ", ".join(loaded) or "-"
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
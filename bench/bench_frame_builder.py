@@ -0,0 +1,124 @@
+"""
+Benchmark for building report frames from Cost Explorer results
+
+Compares the previous list of dicts + pd.DataFrame(rows) path with
+frame_builder.CostFrameBuilder on synthetic ResultsByTime entries, reporting
+time and peak traced memory. "folded s" is the builder holding at most
+TOP_N_MAX_GROUPS groups, as for reports with TopN, its totals are checked
+against the full frame.
+
+    python bench/bench_frame_builder.py
+"""
+
+import datetime
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "../src"))
+
+from frame_builder import CostFrameBuilder  # noqa: E402
+from top_n import TOP_N_MAX_GROUPS  # noqa: E402
+
+
+def synthetic_results(days, groups):
+    start = datetime.date(2024, 1, 1)
+    results = []
+    for day in range(days):
+        date = start + datetime.timedelta(days=day)
+        results.append(
+            {
+                "TimePeriod": {
+                    "Start": date.isoformat(),
+                    "End": (date + datetime.timedelta(days=1)).isoformat(),
+                },
+                "Total": {},
+                "Groups": [
+                    {
+                        "Keys": ["usage-type-{}".format(group)],
+                        "Metrics": {
+                            "UnblendedCost": {
+                                "Amount": str((day * 7 + group) % 113 / 7),
+                                "Unit": "USD",
+                            }
+                        },
+                    }
+                    # Not every group has spend every day
+                    for group in range(groups)
+                    if (group + day) % 5
+                ],
+                "Estimated": False,
+            }
+        )
+    return results
+
+
+def legacy_frame(results):
+    rows = []
+    for v in results:
+        row = {"date": v["TimePeriod"]["Start"]}
+        for i in v["Groups"]:
+            row.update({i["Keys"][0]: float(i["Metrics"]["UnblendedCost"]["Amount"])})
+        if not v["Groups"]:
+            row.update({"Total": float(v["Total"]["UnblendedCost"]["Amount"])})
+        rows.append(row)
+    df = pd.DataFrame(rows)
+    df.set_index("date", inplace=True)
+    return df.fillna(0.0)
+
+
+def columnar_frame(results, max_groups=None):
+    builder = CostFrameBuilder(
+        ["UnblendedCost"], rows=len(results), max_groups=max_groups
+    )
+    for v in results:
+        builder.add(v)
+    return builder.frame()
+
+
+def folded_frame(results):
+    return columnar_frame(results, max_groups=TOP_N_MAX_GROUPS)
+
+
+def measure(fn, results):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = fn(results)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return df, seconds, peak / 2**20
+
+
+def main():
+    print(
+        "{:>6} {:>7} {:>10} {:>10} {:>10} {:>11} {:>11}".format(
+            "days",
+            "groups",
+            "legacy s",
+            "column s",
+            "folded s",
+            "legacy MiB",
+            "column MiB",
+        )
+    )
+    for days, groups in ((30, 100), (90, 1000), (365, 2000), (90, 10000)):
+        results = synthetic_results(days, groups)
+        legacy, legacy_s, legacy_mb = measure(legacy_frame, results)
+        column, column_s, column_mb = measure(columnar_frame, results)
+        folded, folded_s, _ = measure(folded_frame, results)
+        pd.testing.assert_frame_equal(legacy, column, check_names=False)
+        assert np.allclose(folded.sum(axis=1), legacy.sum(axis=1))
+        print(
+            "{:>6} {:>7} {:>10.3f} {:>10.3f} {:>10.3f} {:>11.1f} {:>11.1f}".format(
+                days, groups, legacy_s, column_s, folded_s, legacy_mb, column_mb
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark for building the report end to end, offline
+
+Runs add_report, add_ri_report, add_per_dog_report and generate_excel
+against responses of the synthetic Cost Explorer client of local_aws.py, or a
+fixture recorded with local_aws.RecordingClient, and reports latency, peak
+traced memory and API calls per step. Synthetic responses are recorded in a
+first pass and replayed in the measured one, so generating them is not timed.
+
+    python bench/bench_reports.py
+    python bench/bench_reports.py --fixture ce.json
+
+Fixtures match requests exactly, and report dates are relative to today, so
+replay a fixture on the day it was recorded.
+"""
+
+import argparse
+import datetime
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "../src"))
+
+# Keep caches out of /tmp and measure the code rather than the request rate
+WORKDIR = tempfile.mkdtemp()
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("REPORT_DIR", WORKDIR)
+os.environ.setdefault("ACCOUNT_CACHE_PATH", os.path.join(WORKDIR, "accounts.json"))
+os.environ.setdefault("TAG_CACHE_PATH", os.path.join(WORKDIR, "tag_values.json"))
+os.environ.setdefault("RECOMMENDATION_CACHE", "false")
+os.environ.setdefault("CE_REQUESTS_PER_SECOND", "1000")
+
+import rds_access  # noqa: E402
+from cost_explorer_report import CostExplorer  # noqa: E402
+from local_aws import (  # noqa: E402
+    LocalCostExplorer,
+    LocalOrganizations,
+    RecordingClient,
+    ReplayClient,
+)
+
+# days x groups per period x periods per page
+SIZES = ((7, 20, None), (90, 200, 30), (365, 1000, 90))
+
+
+def synthetic_dogs(end):
+    """get_dogs_per_day stand-in, the database is not part of the benchmark"""
+
+    def get_dogs_per_day(n_days=14):
+        dates = [end - datetime.timedelta(days=day) for day in range(n_days)]
+        df = pd.DataFrame(
+            {"n_dogs": [float(96 + day % 5) for day in range(n_days)]},
+            index=pd.Index([date.isoformat() for date in reversed(dates)], name="date"),
+        )
+        return df
+
+    return get_dogs_per_day
+
+
+def steps(costexplorer):
+    service = [{"Type": "DIMENSION", "Key": "SERVICE"}]
+    account = [{"Type": "DIMENSION", "Key": "LINKED_ACCOUNT"}]
+    yield "add_report", lambda: (
+        costexplorer.add_report(Name="Services", GroupBy=service, Style="Total"),
+        costexplorer.add_report(Name="Accounts", GroupBy=account, Style="Change"),
+    )
+    yield "add_ri_report", lambda: (
+        costexplorer.add_ri_report(Name="RICoverage"),
+        costexplorer.add_ri_report(Name="RIUtilization"),
+        costexplorer.add_ri_report(Name="RIRecommendation"),
+    )
+    yield "add_per_dog_report", costexplorer.add_per_dog_report
+    yield "generate_excel", lambda: costexplorer.generate_excel(Output=io.BytesIO())
+
+
+def api_calls(clients):
+    return sum(sum(client.calls.values()) for client in clients)
+
+
+def run(label, costexplorer, clients):
+    for step, fn in steps(costexplorer):
+        calls = api_calls(clients)
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(
+            "{:>16} {:>18} {:>9.3f} {:>9.1f} {:>6}".format(
+                label, step, seconds, peak / 2**20, api_calls(clients) - calls
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fixture", help="replay a RecordingClient fixture")
+    args = parser.parse_args()
+
+    print(
+        "{:>16} {:>18} {:>9} {:>9} {:>6}".format(
+            "size", "step", "seconds", "peak MiB", "calls"
+        )
+    )
+    if args.fixture:
+        client = ReplayClient(args.fixture)
+        organizations = LocalOrganizations()
+        costexplorer = CostExplorer(client=client, organizations=organizations)
+        rds_access.get_dogs_per_day = synthetic_dogs(costexplorer.end)
+        run("fixture", costexplorer, [client, organizations])
+        return
+
+    for days, groups, page_size in SIZES:
+        organizations = LocalOrganizations(n_accounts=groups)
+        recorder = RecordingClient(
+            LocalCostExplorer(
+                groups=groups,
+                page_size=page_size,
+                accounts=organizations.account_ids(),
+            ),
+            path=None,
+        )
+        label = "{}x{}/{}".format(days, groups, page_size or "all")
+        for client in (recorder, ReplayClient(records=recorder.records)):
+            if os.path.exists(os.environ["ACCOUNT_CACHE_PATH"]):
+                os.remove(os.environ["ACCOUNT_CACHE_PATH"])
+            organizations.calls.clear()
+            costexplorer = CostExplorer(client=client, organizations=organizations)
+            costexplorer.start = costexplorer.end - datetime.timedelta(days=days)
+            rds_access.get_dogs_per_day = synthetic_dogs(costexplorer.end)
+            if client is recorder:
+                for step, fn in steps(costexplorer):
+                    fn()
+            else:
+                run(label, costexplorer, [client, organizations])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark for cutting reports to their top groups
+
+Compares the previous sort by last period + sort by total + iloc[:10] with
+top_n.top_n, which selects the top groups with np.argpartition and keeps
+the remainder as an "Other" row, on synthetic groups x periods frames.
+
+    python bench/bench_top_n.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "../src"))
+
+from top_n import top_n  # noqa: E402
+
+
+def synthetic_frame(groups, days):
+    rng = np.random.default_rng(0)
+    # Heavy tailed like real spend, a few groups carry most of it
+    values = rng.pareto(1.5, size=(groups, days))
+    return pd.DataFrame(
+        values,
+        index=["usage-type-{}".format(group) for group in range(groups)],
+        columns=pd.Index(
+            pd.date_range("2024-01-01", periods=days).strftime("%Y-%m-%d"),
+            name="date",
+        ),
+    )
+
+
+def sorted_top(df):
+    df = df.sort_values(df.columns[-1], ascending=False)
+    df["total"] = df.sum(axis=1)
+    df = df.sort_values("total", ascending=False)
+    return df.iloc[:10, :]
+
+
+def best_of(fn, df, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(df)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    print("{:>8} {:>6} {:>10} {:>10}".format("groups", "days", "sorted s", "top_n s"))
+    for groups, days in ((100, 30), (5000, 90), (50000, 90), (50000, 365)):
+        df = synthetic_frame(groups, days)
+        old, old_s = best_of(sorted_top, df)
+        new, new_s = best_of(lambda df: top_n(df, 10), df)
+        pd.testing.assert_frame_equal(old, new.iloc[:10])
+        assert np.isclose(new["total"].sum(), df.to_numpy().sum())
+        print("{:>8} {:>6} {:>10.4f} {:>10.4f}".format(groups, days, old_s, new_s))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Account Cache
+
+Maps linked account IDs to their ACCOUNT_LABEL (Email or Name). The mapping
+is kept in a small JSON file (optionally in S3) and is only refreshed from
+Organizations when it is older than the TTL or an ID is missing from it.
+Changes are written once per run, by save() at the end of
+run_planned_reports, not for every ID looked up.
+"""
+
+import logging
+import os
+import time
+
+import boto3
+
+from json_store import JsonStore
+
+ACCOUNT_CACHE_PATH = os.getenv("ACCOUNT_CACHE_PATH", "/tmp/account_labels.json")
+ACCOUNT_CACHE_BUCKET = os.getenv("ACCOUNT_CACHE_BUCKET")
+ACCOUNT_CACHE_KEY = os.getenv("ACCOUNT_CACHE_KEY", "cache/account_labels.json")
+ACCOUNT_CACHE_TTL = int(os.getenv("ACCOUNT_CACHE_TTL", str(24 * 60 * 60)))
+
+
+class AccountDirectory:
+    """Lazily loaded account ID -> label mapping
+    >>> accounts = AccountDirectory(label="Email")
+    >>> accounts.label("123456789012")
+    >>> accounts.save()
+    """
+
+    def __init__(
+        self,
+        label="Email",
+        path=ACCOUNT_CACHE_PATH,
+        bucket=ACCOUNT_CACHE_BUCKET,
+        key=ACCOUNT_CACHE_KEY,
+        ttl=ACCOUNT_CACHE_TTL,
+        client=None,
+    ):
+        self.label_field = label
+        self.store = JsonStore(path, bucket, key, name="account cache")
+        self.ttl = ttl
+        self.client = client
+        self.labels = None
+        # IDs Organizations did not know at the last refresh (e.g. closed
+        # accounts), not worth another refresh until the TTL expires
+        self.unknown = set()
+        self.updated = 0
+        self.refreshed = False
+        # Changes are written once, by save() after the reports are built
+        self.dirty = False
+
+    def load(self):
+        if self.labels is not None:
+            return
+        cache = self.store.read()
+        # A cache written for the other ACCOUNT_LABEL is of no use
+        if cache and cache.get("label") == self.label_field:
+            self.labels = cache["accounts"]
+            self.unknown = set(cache.get("unknown", []))
+            self.updated = cache["updated"]
+        else:
+            self.labels = {}
+
+    def save(self):
+        """Write the mapping if this run changed it"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        self.store.write(
+            {
+                "label": self.label_field,
+                "updated": self.updated,
+                "accounts": self.labels,
+                "unknown": sorted(self.unknown),
+            }
+        )
+
+    def refresh(self):
+        """Reload every account from Organizations, at most once per run"""
+        self.refreshed = True
+        client = self.client or boto3.client("organizations", region_name="us-east-1")
+        labels = {}
+        try:
+            paginator = client.get_paginator("list_accounts")
+            for response in paginator.paginate():
+                for acc in response["Accounts"]:
+                    labels[acc["Id"]] = acc[self.label_field]
+        except client.exceptions.AWSOrganizationsNotInUseException:
+            logging.exception("Getting Account names failed")
+            return
+        self.labels = labels
+        self.unknown = set()
+        self.updated = time.time()
+        self.dirty = True
+
+    def label(self, account_id):
+        """Label of account_id, the ID itself when it is not known"""
+        self.load()
+        stale = time.time() - self.updated > self.ttl
+        missing = account_id not in self.labels and account_id not in self.unknown
+        if (stale or missing) and not self.refreshed:
+            self.refresh()
+        if account_id not in self.labels and account_id not in self.unknown:
+            self.unknown.add(account_id)
+            self.dirty = True
+        return self.labels.get(account_id, account_id)
@@ -0,0 +1,58 @@
+"""
+Change Styles
+
+Vectorized period comparisons for report frames. Frames have one row per
+period (the CE TimePeriod Start) and one column per group, the result keeps
+the same layout. Periods without anything to compare against are 0, except
+for the first row of Style="Change" which keeps its original value.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+ROLLING_PERIODS = int(os.getenv("ROLLING_PERIODS", "7"))
+
+STYLES = (
+    "Total",
+    "Change",
+    "PercentChange",
+    "RollingChange",
+    "WeekOverWeek",
+    "MonthOverMonth",
+)
+
+
+def _previous(df, offset):
+    """Values of the period `offset` before each row, NaN when not fetched"""
+    dates = pd.to_datetime(df.index)
+    previous = df.set_axis(dates, axis=0).reindex(dates - offset)
+    return previous.to_numpy(dtype=float)
+
+
+def apply_style(df, Style="Total", periods=ROLLING_PERIODS):
+    if Style == "Total":
+        return df
+    values = df.to_numpy(dtype=float)
+    if Style == "Change":
+        # Difference to the previous period, first period kept as is
+        result = np.empty_like(values)
+        result[:1] = values[:1]
+        result[1:] = values[1:] - values[:-1]
+    elif Style == "PercentChange":
+        result = np.zeros_like(values)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result[1:] = (values[1:] - values[:-1]) / values[:-1] * 100
+    elif Style == "RollingChange":
+        # Difference to the mean of the preceding `periods` periods
+        trailing = df.rolling(periods, min_periods=1).mean().shift(1)
+        result = values - trailing.to_numpy(dtype=float)
+    elif Style == "WeekOverWeek":
+        result = values - _previous(df, pd.DateOffset(weeks=1))
+    elif Style == "MonthOverMonth":
+        result = values - _previous(df, pd.DateOffset(months=1))
+    else:
+        raise ValueError("Unknown Style {}, expected one of {}".format(Style, STYLES))
+    result[~np.isfinite(result)] = 0.0
+    return pd.DataFrame(result, index=df.index, columns=df.columns)
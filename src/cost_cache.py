@@ -0,0 +1,148 @@
+"""
+Cost Cache
+
+A local SQLite store of Cost Explorer results, one row per query and period.
+Only finalized periods are kept, so a run only asks Cost Explorer for the
+periods that are missing or may still change. The database file can be kept
+in S3 between Lambda runs.
+"""
+
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+import boto3
+from botocore.exceptions import ClientError
+from dateutil.relativedelta import relativedelta
+
+from tag_cache import merge_results
+
+COST_CACHE_PATH = os.getenv("COST_CACHE_PATH", "/tmp/cost_cache.sqlite")
+COST_CACHE_BUCKET = os.getenv("COST_CACHE_BUCKET")
+COST_CACHE_KEY = os.getenv("COST_CACHE_KEY", "cache/cost_cache.sqlite")
+# Cost Explorer keeps revising recent days, so they are never cached
+COST_CACHE_MUTABLE_DAYS = int(os.getenv("COST_CACHE_MUTABLE_DAYS", "3"))
+
+
+def to_date(value):
+    return datetime.datetime.strptime(value[:10], "%Y-%m-%d").date()
+
+
+def periods(start, end, granularity):
+    """Start dates of the periods Cost Explorer returns for [start, end)"""
+    if granularity == "MONTHLY":
+        step = relativedelta(months=+1)
+        current = start
+        result = []
+        while current < end:
+            result.append(current)
+            current = (current + step).replace(day=1)
+        return result
+    step = datetime.timedelta(days=1)
+    return [start + step * i for i in range((end - start).days)]
+
+
+class CostCache:
+    """Caches finalized DAILY / MONTHLY get_cost_and_usage periods
+    >>> cache = CostCache()
+    >>> results = cache.get(params, fetch)
+    >>> cache.save()
+    """
+
+    GRANULARITIES = ("DAILY", "MONTHLY")
+
+    def __init__(
+        self,
+        path=COST_CACHE_PATH,
+        bucket=COST_CACHE_BUCKET,
+        key=COST_CACHE_KEY,
+        mutable_days=COST_CACHE_MUTABLE_DAYS,
+    ):
+        self.path = path
+        self.bucket = bucket
+        self.key = key
+        self.mutable_days = mutable_days
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS cost_results "
+            "(query TEXT, period TEXT, result TEXT, PRIMARY KEY (query, period))"
+        )
+
+    def load(self):
+        if not self.bucket or os.path.exists(self.path):
+            return
+        s3 = boto3.client("s3")
+        try:
+            s3.download_file(self.bucket, self.key, self.path)
+        except ClientError:
+            logging.info("No cost cache in s3://%s/%s yet", self.bucket, self.key)
+
+    def save(self):
+        """Upload the database to S3 if this run added finalized periods"""
+        if not self.bucket or not self.dirty:
+            return
+        self.db.commit()
+        boto3.client("s3").upload_file(self.path, self.bucket, self.key)
+        self.dirty = False
+
+    def is_final(self, result):
+        if result.get("Estimated"):
+            return False
+        end = to_date(result["TimePeriod"]["End"])
+        cutoff = datetime.date.today() - datetime.timedelta(days=self.mutable_days)
+        return end <= cutoff
+
+    def get(self, params, fetch):
+        """Results for params, calling fetch(params) only from the first
+        period that is not cached yet.
+        """
+        if params["Granularity"] not in self.GRANULARITIES:
+            return list(fetch(params))
+
+        query = json.dumps(
+            {k: v for k, v in params.items() if k != "TimePeriod"}, sort_keys=True
+        )
+        start = to_date(params["TimePeriod"]["Start"])
+        end = to_date(params["TimePeriod"]["End"])
+        wanted = [p.isoformat() for p in periods(start, end, params["Granularity"])]
+
+        with self.lock:
+            cached = dict(
+                self.db.execute(
+                    "SELECT period, result FROM cost_results "
+                    "WHERE query = ? AND period >= ? AND period < ?",
+                    (query, wanted[0] if wanted else "", end.isoformat()),
+                )
+            )
+        missing = [p for p in wanted if p not in cached]
+        if not missing:
+            return [json.loads(cached[p]) for p in wanted]
+
+        # Cached periods before the first gap are reused, the rest is fetched
+        # in a single request.
+        results = [json.loads(cached[p]) for p in wanted if p < missing[0]]
+        fetch_params = dict(params)
+        fetch_params["TimePeriod"] = {"Start": missing[0], "End": end.isoformat()}
+        # A period whose groups span several pages is stored as one row
+        fetched = list(merge_results([fetch(fetch_params)]))
+        results.extend(fetched)
+
+        final = [
+            (query, r["TimePeriod"]["Start"][:10], json.dumps(r))
+            for r in fetched
+            if self.is_final(r)
+        ]
+        if final:
+            with self.lock:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO cost_results VALUES (?, ?, ?)", final
+                )
+                self.db.commit()
+                self.dirty = True
+        return results
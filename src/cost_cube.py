@@ -0,0 +1,66 @@
+"""
+Cost Cube
+
+Holds a two key GroupBy result (e.g. SERVICE x REGION) as a Series indexed by
+(date, key, key) and derives single dimension reports, the Total and coarser
+granularities from it by local aggregation.
+"""
+
+import pandas as pd
+
+ROLLUPS = {"WEEKLY": "W-SUN", "MONTHLY": "M"}
+
+
+def build_cube(results, dimensions, metric="UnblendedCost", key_labels=None):
+    """Series of metric amounts indexed by (date, *dimensions)
+
+    key_labels maps a dimension to a function relabelling its keys, e.g.
+    LINKED_ACCOUNT IDs to account names.
+    """
+    key_labels = key_labels or {}
+    labels = [key_labels.get(dimension) for dimension in dimensions]
+    dates = []
+    keys = [[] for _ in dimensions]
+    amounts = []
+    periods = []
+    for result in results:
+        date = result["TimePeriod"]["Start"]
+        periods.append(date)
+        for group in result["Groups"]:
+            dates.append(date)
+            for values, label, key in zip(keys, labels, group["Keys"]):
+                values.append(label(key) if label else key)
+            amounts.append(float(group["Metrics"][metric]["Amount"]))
+    index = pd.MultiIndex.from_arrays(
+        # A period spanning several pages is listed once, in order
+        [pd.Categorical(dates, categories=list(dict.fromkeys(periods)))]
+        + [pd.Categorical(values) for values in keys],
+        names=["date"] + list(dimensions),
+    )
+    return pd.Series(amounts, index=index, dtype=float)
+
+
+def rollup(cube, dimension=None):
+    """Periods x groups frame of one dimension, or a single Total column"""
+    if dimension is None:
+        df = cube.groupby(level="date", observed=False).sum().to_frame("Total")
+    else:
+        df = (
+            cube.groupby(level=["date", dimension], observed=True)
+            .sum()
+            .unstack(fill_value=0.0)
+        )
+        # Periods without any spend still get a row
+        df = df.reindex(cube.index.levels[0], fill_value=0.0)
+        df.columns = list(df.columns)
+    df.index = pd.Index(list(df.index), name="date")
+    return df
+
+
+def resample(df, granularity):
+    """Roll a DAILY frame up to WEEKLY (weeks starting Monday) or MONTHLY"""
+    periods = pd.to_datetime(df.index).to_period(ROLLUPS[granularity])
+    starts = periods.start_time.strftime("%Y-%m-%d")
+    df = df.groupby(starts, sort=True).sum()
+    df.index.name = "date"
+    return df
@@ -25,24 +25,43 @@ A script, for local or lambda use, to generate CostExplorer excel graphs
 from __future__ import print_function
 
 import datetime
-import logging
+import io
 import os
 import sys
 
-# For email
-from email.mime.application import MIMEApplication
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.utils import COMMASPACE, formatdate
-
 import boto3
 import pandas as pd
 
 # For date
 from dateutil.relativedelta import relativedelta
 
-# for rds access
-import rds_access
+# rds_access (psycopg2), delivery (email), excel_writer (xlsxwriter), exporters
+# and local_aws are imported where they are used, so a cold start only loads
+# what the configured reports need.
+from account_cache import AccountDirectory
+from change_styles import STYLES, apply_style
+from cost_cache import CostCache, periods
+from cost_cube import ROLLUPS, build_cube, resample, rollup
+from frame_builder import CostFrameBuilder
+from history import REPORT_HISTORY, History
+from instrumentation import Instrumentation
+from paginator import iter_results
+from query_planner import QueryPlanner
+from ri_data import RIData, ri_slice
+from ri_sweep import (
+    PAYMENT_OPTIONS,
+    RECOMMENDATION_CACHE,
+    RI_SERVICES,
+    TERMS,
+    RecommendationCache,
+    recommendation_rows,
+    recommendation_table,
+    sweep_params,
+)
+from tag_cache import TagValueResolver, merge_results, split_tag_filter
+from throttle import Throttle
+from top_n import TOP_N, TOP_N_MAX_GROUPS, top_n
+from unit_cost import DENOMINATORS, daily_units, unit_cost
 
 # Required to load modules from vendored subfolder (for clean development env)
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "./vendored"))
@@ -69,6 +88,45 @@ if INC_SUPPORT == "true":
 else:
     INC_SUPPORT = False
 
+# Keep finalized cost periods between runs, see cost_cache.py
+COST_CACHE = os.getenv("COST_CACHE", "false")
+if COST_CACHE == "true":
+    COST_CACHE = True
+else:
+    COST_CACHE = False
+
+# Reports are fetched concurrently, requests are rate limited in throttle.py
+CE_MAX_WORKERS = int(os.getenv("CE_MAX_WORKERS", "4"))
+
+# Default report names for plan_cube_reports
+CUBE_REPORT_NAMES = {
+    "SERVICE": "Services",
+    "REGION": "Regions",
+    "LINKED_ACCOUNT": "Accounts",
+}
+# Names plan_ri_report knows
+RI_REPORT_NAMES = (
+    "RICoverage",
+    "RIUtilization",
+    "RIUtilizationSavings",
+    "RIRecommendation",
+)
+
+# Where generate_excel writes the report, and whether rows are streamed
+REPORT_DIR = os.getenv("REPORT_DIR", "/tmp")
+EXCEL_CONSTANT_MEMORY = os.getenv("EXCEL_CONSTANT_MEMORY", "true")
+if EXCEL_CONSTANT_MEMORY == "true":
+    EXCEL_CONSTANT_MEMORY = True
+else:
+    EXCEL_CONSTANT_MEMORY = False
+
+# Output formats, xlsx is the emailed workbook, csv / parquet are exported
+EXPORT_FORMATS = os.getenv("EXPORT_FORMATS", "xlsx").split(",")
+EXPORT_PREFIX = os.getenv("EXPORT_PREFIX", "exports/")
+
+# Deliver to directory backed S3 / SES stand-ins instead of AWS, see local_aws.py
+LOCAL_AWS_DIR = os.getenv("LOCAL_AWS_DIR")
+
 TAG_VALUE_FILTER = os.getenv("TAG_VALUE_FILTER", "*")
 TAG_KEY = os.getenv("TAG_KEY")
 
@@ -78,22 +136,63 @@ class CostExplorer:
     >>> costexplorer = CostExplorer()
     >>> costexplorer.add_report(GroupBy=[{"Type": "DIMENSION","Key": "SERVICE"}])
     >>> costexplorer.generate_excel()
+
+    client and organizations replace the boto3 clients, e.g. with the
+    synthetic or replaying clients of local_aws.py.
     """
 
-    def __init__(self, report_name="cost_explorer_report.xlsx"):
+    def __init__(
+        self,
+        report_name="cost_explorer_report.xlsx",
+        client=None,
+        organizations=None,
+        cost_cache=COST_CACHE,
+        recommendation_cache=RECOMMENDATION_CACHE,
+        history=REPORT_HISTORY,
+    ):
         # Array of reports ready to be output to Excel.
         self.reports = []
         self.report_name = report_name
-        self.client = boto3.client("ce", region_name="us-east-1")
+        self.report_path = os.path.join(REPORT_DIR, report_name)
+        self.client = client or boto3.client("ce", region_name="us-east-1")
+        self.set_period()
+        # Module globals are the defaults, a report spec can override them
+        self.inc_support = INC_SUPPORT
+        self.tag_key = TAG_KEY
+        self.tag_value_filter = TAG_VALUE_FILTER
+        self.tags = TagValueResolver(lambda p: self._iter_results("get_tags", p))
+        # Account labels are only looked up for LINKED_ACCOUNT groups
+        self.accounts = AccountDirectory(label=ACCOUNT_LABEL, client=organizations)
+        self.planner = QueryPlanner(max_workers=CE_MAX_WORKERS)
+        self.throttle = Throttle()
+        self.ri_data = RIData()
+        self.cost_cache = CostCache() if cost_cache else None
+        self.history = History() if history else None
+        self.recommendation_cache = (
+            RecommendationCache() if recommendation_cache else None
+        )
+        self.metrics = Instrumentation()
+        # Keep the periods x groups frame of cost reports, before Style and
+        # TopN, see fan_out.py and the Parquet history in exporters.py
+        self.keep_frames = "parquet" in EXPORT_FORMATS
+
+    def set_period(
+        self,
+        TrailingDays=TRAILING_DAYS,
+        CurrentDay=CURRENT_DAY,
+        LastMonthOnly=LAST_MONTH_ONLY,
+    ):
+        """Report window, set from the environment unless overridden"""
+        self.trailing_days = TrailingDays
         self.end = datetime.date.today() - datetime.timedelta(days=1)
         self.riend = datetime.date.today()
-        if CURRENT_DAY:
+        if CurrentDay:
             self.end = self.riend
 
-        if TRAILING_DAYS:
+        if TrailingDays:
             # generally only want like 7 days worth of dat
-            self.start = datetime.date.today() - relativedelta(days=+int(TRAILING_DAYS))
-        elif LAST_MONTH_ONLY:
+            self.start = datetime.date.today() - relativedelta(days=+int(TrailingDays))
+        elif LastMonthOnly:
             self.start = (datetime.date.today() - relativedelta(months=+1)).replace(
                 day=1
             )  # 1st day of month a month ago
@@ -109,24 +208,82 @@ class CostExplorer:
         self.sixmonth = (datetime.date.today() - relativedelta(months=+6)).replace(
             day=1
         )  # 1st day of month 6 months ago, so RI util has savings values
-        self.accounts = self.get_accounts()
-
-    def get_accounts(self):
-        accounts = {}
-        client = boto3.client("organizations", region_name="us-east-1")
-        try:
-            paginator = client.get_paginator("list_accounts")
-            response_iterator = paginator.paginate()
-            for response in response_iterator:
-                for acc in response["Accounts"]:
-                    accounts[acc["Id"]] = acc
-        except client.exceptions.AWSOrganizationsNotInUseException:
-            logging.exception("Getting Account names failed")
-            accounts = {}
-
-        return accounts
-
-    def add_ri_report(
+
+    def _call(self, fn, **kwargs):
+        # Time in throttle.call outside the request itself is rate limit waits
+        with self.metrics.phase(self.metrics.current(), "throttle"):
+            return self.throttle.call(self.metrics.request(fn), **kwargs)
+
+    def _iter_results(self, operation, params):
+        return iter_results(self.client, operation, params, call=self._call)
+
+    def _fetch(self, operation, params):
+        if self.cost_cache and operation == "get_cost_and_usage":
+            return self.cost_cache.get(
+                params, lambda p: self._iter_results(operation, p)
+            )
+        if (
+            self.recommendation_cache
+            and operation == "get_reservation_purchase_recommendation"
+        ):
+            return self.recommendation_cache.get(
+                params, lambda p: self._iter_results(operation, p)
+            )
+        return self._iter_results(operation, params)
+
+    def _plan_query(self, operation, params, derive, name):
+        """Register a query, its fetch and derive are timed against name.
+        A query shared by several reports is charged to the first one.
+        """
+        signature = self.planner.signature(operation, params)
+        batches = [params]
+        if operation == "get_cost_and_usage":
+            batches = split_tag_filter(params)
+        if len(batches) > 1:
+            # Tag values beyond one filter are fetched in batches and summed
+            def fetch():
+                return merge_results(
+                    [list(self._fetch(operation, batch)) for batch in batches]
+                )
+
+        else:
+
+            def fetch():
+                return self._fetch(operation, params)
+
+        self.planner.register(
+            signature, self._timed_fetch(name, fetch), self._timed_derive(name, derive)
+        )
+
+    def _timed_fetch(self, name, fetch, phase="processing"):
+        def timed():
+            with self.metrics.phase(name, phase):
+                for result in fetch():
+                    yield result
+
+        return timed
+
+    def _timed_derive(self, name, derive):
+        def timed(results):
+            with self.metrics.phase(name, "processing"):
+                derive(results)
+
+        return timed
+
+    def run_planned_reports(self):
+        """Fetch every planned report, running each unique query only once"""
+        self.planner.execute()
+        self.accounts.save()
+        if self.cost_cache:
+            self.cost_cache.save()
+        if self.recommendation_cache:
+            self.recommendation_cache.save()
+
+    def add_ri_report(self, **kwargs):
+        self.plan_ri_report(**kwargs)
+        self.run_planned_reports()
+
+    def plan_ri_report(
         self,
         Name="RICoverage",
         Savings=False,
@@ -134,171 +291,211 @@ class CostExplorer:
         Service="Amazon Elastic Compute Cloud - Compute",
         Granularity="DAILY",
     ):  # Call with Savings True to get Utilization report in dollar savings
-        type = "chart"  # other option table
-        if Name == "RICoverage":
-            results = []
-            response = self.client.get_reservation_coverage(
-                TimePeriod={
-                    "Start": self.ristart.isoformat(),
-                    "End": self.riend.isoformat(),
-                },
-                Granularity=Granularity,
-            )
-            results.extend(response["CoveragesByTime"])
-            while "nextToken" in response:
-                nextToken = response["nextToken"]
-                response = self.client.get_reservation_coverage(
-                    TimePeriod={
-                        "Start": self.ristart.isoformat(),
-                        "End": self.riend.isoformat(),
-                    },
-                    Granularity=Granularity,
-                    NextPageToken=nextToken,
-                )
-                results.extend(response["CoveragesByTime"])
-                if "nextToken" in response:
-                    nextToken = response["nextToken"]
+        if Name in ["RICoverage", "RIUtilization", "RIUtilizationSavings"]:
+            if Name == "RICoverage":
+                operation = "get_reservation_coverage"
+                field, label = "CoverageHours.CoverageHoursPercentage", "Coverage%"
+                start = self.ristart
+            else:
+                operation = "get_reservation_utilization"
+                if Savings:
+                    field, label = "NetRISavings", "Savings$"
                 else:
-                    nextToken = False
-
-            rows = []
-            for v in results:
-                row = {"date": v["TimePeriod"]["Start"]}
-                row.update(
-                    {
-                        "Coverage%": float(
-                            v["Total"]["CoverageHours"]["CoverageHoursPercentage"]
-                        )
-                    }
+                    field, label = "UtilizationPercentage", "Utilization%"
+                start = self.sixmonth  # Only Six month to support savings
+            end = self.riend
+            # One fetch per endpoint over every RI report's window, see ri_data.py
+            signature = self.ri_data.request(operation, Granularity, start, end)
+
+            def fetch():
+                return self._fetch(
+                    operation, self.ri_data.params(operation, Granularity)
                 )
-                rows.append(row)
-
-            df = pd.DataFrame(rows)
-            df.set_index("date", inplace=True)
-            df = df.fillna(0.0)
-            df = df.T
-        elif Name in ["RIUtilization", "RIUtilizationSavings"]:
-            # Only Six month to support savings
-            results = []
-            response = self.client.get_reservation_utilization(
-                TimePeriod={
-                    "Start": self.sixmonth.isoformat(),
-                    "End": self.riend.isoformat(),
-                },
-                Granularity=Granularity,
+
+            def derive(results):
+                df = self.ri_data.frame(signature, results)
+                df = ri_slice(df, field, label, start, end)
+                type = "chart" if not df.empty else "table"  # Dont chart empty result
+                self.reports.append({"Name": Name, "Data": df, "Type": type})
+
+            self.planner.register(
+                signature,
+                self._timed_fetch(Name, fetch),
+                self._timed_derive(Name, derive),
             )
-            results.extend(response["UtilizationsByTime"])
-            while "nextToken" in response:
-                nextToken = response["nextToken"]
-                response = self.client.get_reservation_utilization(
-                    TimePeriod={
-                        "Start": self.sixmonth.isoformat(),
-                        "End": self.riend.isoformat(),
-                    },
-                    Granularity=Granularity,
-                    NextPageToken=nextToken,
-                )
-                results.extend(response["UtilizationsByTime"])
-                if "nextToken" in response:
-                    nextToken = response["nextToken"]
-                else:
-                    nextToken = False
-
-            rows = []
-            if results:
-                for v in results:
-                    row = {"date": v["TimePeriod"]["Start"]}
-                    if Savings:
-                        row.update({"Savings$": float(v["Total"]["NetRISavings"])})
-                    else:
-                        row.update(
-                            {"Utilization%": float(v["Total"]["UtilizationPercentage"])}
+        elif Name == "RIRecommendation":
+            params = {
+                # AccountId='string', May use for Linked view
+                "LookbackPeriodInDays": "SIXTY_DAYS",
+                "TermInYears": "ONE_YEAR",
+                "PaymentOption": PaymentOption,
+                "Service": Service,
+            }
+
+            def derive(results):
+                rows = []
+                for i in results:
+                    for v in i["RecommendationDetails"]:
+                        row = dict(
+                            v["InstanceDetails"][list(v["InstanceDetails"].keys())[0]]
                         )
-                    rows.append(row)
+                        row["Recommended"] = v["RecommendedNumberOfInstancesToPurchase"]
+                        row["Minimum"] = v["MinimumNumberOfInstancesUsedPerHour"]
+                        row["Maximum"] = v["MaximumNumberOfInstancesUsedPerHour"]
+                        row["Savings"] = v["EstimatedMonthlySavingsAmount"]
+                        row["OnDemand"] = v["EstimatedMonthlyOnDemandCost"]
+                        row["BreakEvenIn"] = v["EstimatedBreakEvenInMonths"]
+                        row["UpfrontCost"] = v["UpfrontCost"]
+                        row["MonthlyCost"] = v["RecurringStandardMonthlyCost"]
+                        rows.append(row)
 
                 df = pd.DataFrame(rows)
-                df.set_index("date", inplace=True)
                 df = df.fillna(0.0)
-                df = df.T
-                type = "chart"
-            else:
-                df = pd.DataFrame(rows)
-                type = "table"  # Dont try chart empty result
-        elif Name == "RIRecommendation":
-            results = []
-            response = self.client.get_reservation_purchase_recommendation(
-                # AccountId='string', May use for Linked view
-                LookbackPeriodInDays="SIXTY_DAYS",
-                TermInYears="ONE_YEAR",
-                PaymentOption=PaymentOption,
-                Service=Service,
+                # Dont try chart this
+                self.reports.append({"Name": Name, "Data": df, "Type": "table"})
+
+            self._plan_query(
+                "get_reservation_purchase_recommendation",
+                params,
+                derive,
+                Name,
             )
-            results.extend(response["Recommendations"])
-            while "nextToken" in response:
-                nextToken = response["nextToken"]
-                response = self.client.get_reservation_purchase_recommendation(
-                    # AccountId='string', May use for Linked view
-                    LookbackPeriodInDays="SIXTY_DAYS",
-                    TermInYears="ONE_YEAR",
-                    PaymentOption=PaymentOption,
-                    Service=Service,
-                    NextPageToken=nextToken,
+        else:
+            raise ValueError(
+                "Unknown RI report {}, expected one of {}".format(
+                    Name, list(RI_REPORT_NAMES)
                 )
-                results.extend(response["Recommendations"])
-                if "nextToken" in response:
-                    nextToken = response["nextToken"]
-                else:
-                    nextToken = False
-
-            rows = []
-            for i in results:
-                for v in i["RecommendationDetails"]:
-                    row = v["InstanceDetails"][list(v["InstanceDetails"].keys())[0]]
-                    row["Recommended"] = v["RecommendedNumberOfInstancesToPurchase"]
-                    row["Minimum"] = v["MinimumNumberOfInstancesUsedPerHour"]
-                    row["Maximum"] = v["MaximumNumberOfInstancesUsedPerHour"]
-                    row["Savings"] = v["EstimatedMonthlySavingsAmount"]
-                    row["OnDemand"] = v["EstimatedMonthlyOnDemandCost"]
-                    row["BreakEvenIn"] = v["EstimatedBreakEvenInMonths"]
-                    row["UpfrontCost"] = v["UpfrontCost"]
-                    row["MonthlyCost"] = v["RecurringStandardMonthlyCost"]
-                    rows.append(row)
-
-            df = pd.DataFrame(rows)
-            df = df.fillna(0.0)
-            type = "table"  # Dont try chart this
-        self.reports.append({"Name": Name, "Data": df, "Type": type})
+            )
+
+    def add_ri_sweep(self, **kwargs):
+        self.plan_ri_sweep(**kwargs)
+        self.run_planned_reports()
+
+    def plan_ri_sweep(
+        self,
+        Name="RISweep",
+        Services=RI_SERVICES,
+        PaymentOptions=PAYMENT_OPTIONS,
+        Terms=TERMS,
+        LookbackPeriodInDays="SIXTY_DAYS",
+        BestOnly=False,
+    ):
+        """Reservation recommendations for every Services x PaymentOptions x
+        Terms combination as one table ranked by savings, see ri_sweep.py.
+        BestOnly keeps one term and payment option per reservation.
+        """
+        sweep = sweep_params(Services, PaymentOptions, Terms, LookbackPeriodInDays)
+        rows = [None] * len(sweep)
+
+        def derive_part(index, params):
+            def derive(results):
+                rows[index] = recommendation_rows(params, results)
+                # The table is built once the last combination is in
+                if all(part is not None for part in rows):
+                    df = recommendation_table(
+                        [row for part in rows for row in part], BestOnly
+                    )
+                    self.reports.append({"Name": Name, "Data": df, "Type": "table"})
+
+            return derive
+
+        for index, params in enumerate(sweep):
+            self._plan_query(
+                "get_reservation_purchase_recommendation",
+                params,
+                derive_part(index, params),
+                Name,
+            )
 
     def add_linked_reports(self, Name="RI_{}", PaymentOption="PARTIAL_UPFRONT"):
         pass
 
-    def add_report(
+    def add_report(self, **kwargs):
+        self.plan_report(**kwargs)
+        self.run_planned_reports()
+
+    def plan_cube_reports(
         self,
-        Name="Default",
-        GroupBy=None,
+        Dimensions=("SERVICE", "REGION"),
+        Reports=None,
         Style="Total",
         Granularity="DAILY",
+        RollUp=None,
         NoCredits=True,
         CreditsOnly=False,
         RefundOnly=False,
         UpfrontOnly=False,
         IncSupport=False,
+        Metric="UnblendedCost",
+        TopN=TOP_N,
     ):
-        type = "chart"  # other option table
-        results = []
-        if not NoCredits:
-            response = self.client.get_cost_and_usage(
-                TimePeriod={
-                    "Start": self.start.isoformat(),
-                    "End": self.end.isoformat(),
-                },
-                Granularity=Granularity,
-                Metrics=[
-                    "UnblendedCost",
-                ],
-                GroupBy=GroupBy,
+        """Fetch two dimensions in one request and derive reports locally
+        >>> costexplorer.plan_cube_reports(
+        ...     Dimensions=("SERVICE", "REGION"),
+        ...     Reports={"Total": None, "Services": "SERVICE", "Regions": "REGION"},
+        ... )
+
+        Reports maps report names to one of Dimensions, or None for the Total.
+        RollUp="WEEKLY" or "MONTHLY" aggregates DAILY data before Style is applied.
+        TopN is as in plan_report.
+        """
+        if Style not in STYLES:
+            raise ValueError(
+                "Unknown Style {}, expected one of {}".format(Style, STYLES)
             )
-        else:
+        if RollUp and RollUp not in ROLLUPS:
+            raise ValueError(
+                "Unknown RollUp {}, expected one of {}".format(RollUp, list(ROLLUPS))
+            )
+        if Reports is None:
+            Reports = {"Total": None}
+            Reports.update({CUBE_REPORT_NAMES.get(d, d): d for d in Dimensions})
+        GroupBy = [{"Type": "DIMENSION", "Key": key} for key in Dimensions]
+        params = self._cost_params(
+            GroupBy,
+            Granularity,
+            [Metric],
+            NoCredits,
+            CreditsOnly,
+            RefundOnly,
+            UpfrontOnly,
+            IncSupport,
+        )
+
+        def derive(results):
+            cube = build_cube(
+                results, Dimensions, Metric, {"LINKED_ACCOUNT": self.accounts.label}
+            )
+            for name, dimension in Reports.items():
+                df = rollup(cube, dimension)
+                if RollUp:
+                    df = resample(df, RollUp)
+                self._add_cost_report(name, df, Style, TopN)
+
+        self._plan_query("get_cost_and_usage", params, derive, ",".join(Reports))
+
+    def _cost_params(
+        self,
+        GroupBy,
+        Granularity,
+        Metrics,
+        NoCredits,
+        CreditsOnly,
+        RefundOnly,
+        UpfrontOnly,
+        IncSupport,
+    ):
+        """get_cost_and_usage request parameters for a report"""
+        params = {
+            "TimePeriod": {
+                "Start": self.start.isoformat(),
+                "End": self.end.isoformat(),
+            },
+            "Granularity": Granularity,
+            "Metrics": Metrics,
+            "GroupBy": GroupBy,
+        }
+        if NoCredits:
             Filter = {"And": []}
 
             Dimensions = {
@@ -310,7 +507,7 @@ class CostExplorer:
                 }
             }
             if (
-                INC_SUPPORT or IncSupport
+                self.inc_support or IncSupport
             ):  # If global set for including support, we dont exclude it
                 Dimensions = {
                     "Not": {
@@ -349,188 +546,343 @@ class CostExplorer:
                 }
 
             tagValues = None
-            if TAG_KEY:
-                tagValues = self.client.get_tags(
-                    SearchString=TAG_VALUE_FILTER,
-                    TimePeriod={
-                        "Start": self.start.isoformat(),
-                        "End": datetime.date.today().isoformat(),
-                    },
-                    TagKey=TAG_KEY,
+            if self.tag_key:
+                tagValues = self.tags.values(
+                    self.tag_key,
+                    self.tag_value_filter,
+                    self.start,
+                    datetime.date.today(),
                 )
 
-            if tagValues:
+            if tagValues is not None:
                 Filter["And"].append(Dimensions)
-                if len(tagValues["Tags"]) > 0:
-                    Tags = {"Tags": {"Key": TAG_KEY, "Values": tagValues["Tags"]}}
+                if len(tagValues) > 0:
+                    Tags = {"Tags": {"Key": self.tag_key, "Values": tagValues}}
                     Filter["And"].append(Tags)
             else:
                 Filter = Dimensions.copy()
+            params["Filter"] = Filter
+        return params
 
-            response = self.client.get_cost_and_usage(
-                TimePeriod={
-                    "Start": self.start.isoformat(),
-                    "End": self.end.isoformat(),
-                },
-                Granularity=Granularity,
-                Metrics=[
-                    "UnblendedCost",
-                ],
-                GroupBy=GroupBy,
-                Filter=Filter,
+    def plan_report(
+        self,
+        Name="Default",
+        GroupBy=None,
+        Style="Total",
+        Granularity="DAILY",
+        NoCredits=True,
+        CreditsOnly=False,
+        RefundOnly=False,
+        UpfrontOnly=False,
+        IncSupport=False,
+        Metrics=None,
+        TopN=TOP_N,
+    ):
+        """Register a report; reports sharing a query are fetched together
+        by run_planned_reports, and Style is applied locally to the result.
+        Style is one of change_styles.STYLES, e.g. Total, Change, PercentChange.
+        Metrics (default UnblendedCost) are fetched in the same request, with
+        several metrics each one becomes its own "<Name>-<Metric>" sheet.
+        TopN groups are kept, the rest is summed into an "Other" row
+        (TopN=None keeps every group).
+        """
+        if not Metrics:
+            Metrics = ["UnblendedCost"]
+        if Style not in STYLES:
+            raise ValueError(
+                "Unknown Style {}, expected one of {}".format(Style, STYLES)
+            )
+        params = self._cost_params(
+            GroupBy,
+            Granularity,
+            Metrics,
+            NoCredits,
+            CreditsOnly,
+            RefundOnly,
+            UpfrontOnly,
+            IncSupport,
+        )
+
+        archived = None
+        fetch_params = params
+        if self.history and Granularity in History.GRANULARITIES:
+            # Only periods missing from the archive are fetched, see history.py
+            archived = {metric: self.history.load(params, metric) for metric in Metrics}
+            fetch_params = self.history.fetch_params(params, archived.values())
+
+        def derive(results):
+            self._add_cost_reports(
+                Name,
+                results,
+                Style,
+                Granularity,
+                Metrics,
+                GroupBy,
+                TopN,
+                params,
+                archived,
             )
 
-        if response:
-            results.extend(response["ResultsByTime"])
-
-            while "nextToken" in response:
-                nextToken = response["nextToken"]
-                response = self.client.get_cost_and_usage(
-                    TimePeriod={
-                        "Start": self.start.isoformat(),
-                        "End": self.end.isoformat(),
-                    },
-                    Granularity=Granularity,
-                    Metrics=[
-                        "UnblendedCost",
-                    ],
-                    GroupBy=GroupBy,
-                    NextPageToken=nextToken,
-                )
+        self._plan_query("get_cost_and_usage", fetch_params, derive, Name)
 
-                results.extend(response["ResultsByTime"])
-                if "nextToken" in response:
-                    nextToken = response["nextToken"]
-                else:
-                    nextToken = False
-        rows = []
-        sort = ""
+    def _add_cost_reports(
+        self,
+        Name,
+        results,
+        Style,
+        Granularity,
+        Metrics,
+        GroupBy,
+        TopN=TOP_N,
+        params=None,
+        archived=None,
+    ):
+        key_label = None
+        if GroupBy and GroupBy[0]["Key"] == "LINKED_ACCOUNT":
+            key_label = self.accounts.label
+        builder = CostFrameBuilder(
+            Metrics,
+            rows=len(periods(self.start, self.end, Granularity)),
+            key_label=key_label,
+            max_groups=TOP_N_MAX_GROUPS if TopN else None,
+        )
         for v in results:
-            row = {"date": v["TimePeriod"]["Start"]}
-            sort = v["TimePeriod"]["Start"]
-            for i in v["Groups"]:
-                key = i["Keys"][0]
-                if key in self.accounts:
-                    key = self.accounts[key][ACCOUNT_LABEL]
-                row.update({key: float(i["Metrics"]["UnblendedCost"]["Amount"])})
-            if not v["Groups"]:
-                row.update({"Total": float(v["Total"]["UnblendedCost"]["Amount"])})
-            rows.append(row)
-
-        df = pd.DataFrame(rows)
-        df.set_index("date", inplace=True)
-        df = df.fillna(0.0)
-
-        if Style == "Change":
-            dfc = df.copy()
-            lastindex = None
-            for index, row in df.iterrows():
-                if lastindex:
-                    for i in row.index:
-                        try:
-                            df.at[index, i] = dfc.at[index, i] - dfc.at[lastindex, i]
-                        except:
-                            logging.exception("Error")
-                            df.at[index, i] = 0
-                lastindex = index
+            builder.add(v)
 
-        # before transposing, rows are dates and columns are services
-        df = df.T
-        df = df.sort_values(sort, ascending=False)
-        df["total"] = df.sum(axis=1)
-        df = df.sort_values("total", ascending=False)  # sort by total spend on services
-        df = df.iloc[:10, :]  # only keep top 10?
-        self.reports.append({"Name": Name, "Data": df, "Type": type})
+        def frame(metric):
+            df = builder.frame(metric)
+            if archived is not None:
+                # Fetched periods appended to the archived ones of the window
+                df = self.history.extend(params, metric, archived[metric], df)
+            return df
 
-    def add_per_dog_report(self):
-        reports = [_report for _report in self.reports if _report["Name"] == "Services"]
-        if reports and len(reports) == 1:
-            report = reports[0]
+        if len(Metrics) == 1:
+            self._add_cost_report(Name, frame(Metrics[0]), Style, TopN)
         else:
-            raise ValueError("Please run the Services report first")
+            for metric in Metrics:
+                name = "{}-{}".format(Name, metric)[:31]  # Excel tabname limit
+                self._add_cost_report(name, frame(metric), Style, TopN)
+
+    def _add_cost_report(self, Name, df, Style, TopN=TOP_N):
+        type = "chart"  # other option table
+        report = {"Name": Name, "Type": type, "Style": Style, "TopN": TopN}
+        if self.keep_frames:
+            # fan_out.py sums these over the payers and applies Style and TopN
+            # to the sum, the groups of one payer's top N are not the total's.
+            # Parquet periods are written from it, a styled value depends on
+            # the window it was computed in.
+            report["Frame"] = df
 
-        df = report["Data"]
-        n_dogs_by_date = rds_access.get_dogs_per_day(n_days=int(TRAILING_DAYS))
-        df = n_dogs_by_date.join(df.T, how="inner")
+        df = apply_style(df, Style)
 
-        def cost_per_dog(col):
-            if col.name != "n_dogs":
-                return col / df["n_dogs"]
-            else:
-                return col
+        # before transposing, rows are dates and columns are services
+        report["Data"] = top_n(df.T, TopN)
+        self.reports.append(report)
 
-        df = df.apply(cost_per_dog, axis=0).T
-        self.reports.append({"Name": "ServicesPerDog", "Data": df, "Type": "chart"})
+    def add_per_dog_report(self):
+        self.plan_per_dog_report()
+        self.run_planned_reports()
+
+    def plan_per_dog_report(self):
+        """Services per dog, see plan_unit_cost_report"""
+        self.plan_unit_cost_report(Report="Services", Denominator="dogs")
+
+    def add_unit_cost_report(self, **kwargs):
+        self.plan_unit_cost_report(**kwargs)
+        self.run_planned_reports()
+
+    def plan_unit_cost_report(self, Report="Services", Denominator="dogs", Name=None):
+        """Report divided by a daily volume from the database, Denominator is
+        one of unit_cost.DENOMINATORS (dogs, runtime_hours, deliveries). The
+        volume is queried alongside the CE reports and divided into Report
+        once it is built, so Report must be planned first. Name defaults to
+        e.g. "ServicesPerDog".
+        """
+        if Denominator not in DENOMINATORS:
+            raise ValueError(
+                "Unknown Denominator {}, expected one of {}".format(
+                    Denominator, list(DENOMINATORS)
+                )
+            )
+        import rds_access  # psycopg2 is only loaded for these reports
+
+        function, column, suffix = DENOMINATORS[Denominator]
+        Name = Name or Report + suffix
+        n_days = (datetime.date.today() - self.start).days
+
+        def derive(results):
+            (volume,) = results
+            reports = [report for report in self.reports if report["Name"] == Report]
+            if len(reports) != 1:
+                raise ValueError("Please run the {} report first".format(Report))
+            df = unit_cost(reports[0]["Data"], daily_units(volume, column), column)
+            self.reports.append(
+                {"Name": Name, "Data": df, "Type": "chart", "Denominator": column}
+            )
 
-    def generate_excel(self):
-        # Create a Pandas Excel writer using XlsxWriter as the engine.\
-        os.chdir("/tmp")
-        writer = pd.ExcelWriter(self.report_name, engine="xlsxwriter")
+        # Unit reports sharing a denominator share its query
+        self.planner.register(
+            "rds:{}:{}".format(function, n_days),
+            self._timed_fetch(
+                Name,
+                lambda: [getattr(rds_access, function)(n_days=n_days)],
+                phase="database",
+            ),
+            self._timed_derive(Name, derive),
+        )
+
+    def generate_excel(self, ConstantMemory=EXCEL_CONSTANT_MEMORY, Output=None):
+        """Write every report to Output, a path or binary file object
+        (default self.report_path). ConstantMemory writes rows one at a time
+        with xlsxwriter instead of building each sheet with DataFrame.to_excel.
+        """
+        from excel_writer import HEADER_FORMAT, add_chart, new_workbook, write_report
+
+        output = Output or self.report_path
+        if ConstantMemory:
+            workbook = new_workbook(output)
+            header_format = workbook.add_format(HEADER_FORMAT)
+            for report in self.reports:
+                with self.metrics.phase(report["Name"], "rendering"):
+                    write_report(workbook, report, header_format)
+            # constant_memory sheets are assembled into the xlsx on close
+            with self.metrics.phase("workbook", "rendering"):
+                workbook.close()
+            return
+        # Create a Pandas Excel writer using XlsxWriter as the engine.
+        writer = pd.ExcelWriter(output, engine="xlsxwriter")
         workbook = writer.book
         for report in self.reports:
-            print(report["Name"], report["Type"])
-            report["Data"].to_excel(writer, sheet_name=report["Name"])
-            worksheet = writer.sheets[report["Name"]]
-            if report["Type"] == "chart":
+            with self.metrics.phase(report["Name"], "rendering"):
+                print(report["Name"], report["Type"])
+                report["Data"].to_excel(writer, sheet_name=report["Name"])
+                worksheet = writer.sheets[report["Name"]]
+                if report["Type"] == "chart":
+                    add_chart(
+                        workbook,
+                        worksheet,
+                        report["Name"],
+                        report["Data"],
+                        "Denominator" in report,
+                    )
+        with self.metrics.phase("workbook", "rendering"):
+            writer.close()
+
+    def output(self, Formats=None):
+        """Write or deliver the workbook and exports in Formats
+        (default EXPORT_FORMATS), then log the run metrics.
+        """
+        Formats = Formats or EXPORT_FORMATS
+        if "xlsx" in Formats:
+            if os.environ.get("S3_BUCKET") or os.environ.get("SES_SEND"):
+                # Rendered in memory and sent from the same buffer
+                self.deliver()
+            else:
+                self.generate_excel()
+        # Columnar copies for analytics, e.g. EXPORT_FORMATS=xlsx,parquet
+        exports = [f for f in Formats if f != "xlsx"]
+        if exports:
+            self.send_exports(self.export(exports))
+        print("Report generated")
+        # JSON lines per report: requests, pages, bytes and time per phase
+        self.metrics.emit()
+
+    def export(self, Formats=None, Directory=REPORT_DIR):
+        """Write the reports as xlsx / csv / parquet files under Directory,
+        returns the written paths. See exporters.py for the layouts.
+        """
+        from exporters import export_reports
+
+        name = os.path.splitext(self.report_name)[0]
+        with self.metrics.phase("exports", "rendering"):
+            return export_reports(
+                self.reports, Formats or EXPORT_FORMATS, Directory, name
+            )
 
-                # Create a chart object.
-                chart = workbook.add_chart({"type": "column", "subtype": "stacked"})
-                df = report["Data"]
+    def send_exports(self, paths, Directory=REPORT_DIR):
+        """Upload exported files to S3_BUCKET, keeping their layout under
+        EXPORT_PREFIX so partitioned Parquet stays queryable.
+        """
+        import delivery
 
-                if "PerDog" in report["Name"]:
-                    row_start = 2
-                else:
-                    row_start = 1
-
-                chartend = df.shape[1]
-                if CURRENT_DAY:
-                    chartend = df.shape[1]
-                for row_num in range(row_start, len(df) + 1):
-                    chart.add_series(
-                        {
-                            "name": [report["Name"], row_num, 0],
-                            "categories": [report["Name"], 0, 1, 0, chartend],
-                            "values": [report["Name"], row_num, 1, row_num, chartend],
-                        }
-                    )
-                chart.set_y_axis({"label_position": "low"})
-                chart.set_x_axis({"label_position": "low"})
-                worksheet.insert_chart("O2", chart, {"x_scale": 2.0, "y_scale": 2.0})
-        writer.save()
+        s3_bucket = os.environ.get("S3_BUCKET")
+        if not s3_bucket:
+            return
+        s3 = self._s3()
+        for path in paths:
+            key = EXPORT_PREFIX + os.path.relpath(path, Directory).replace(os.sep, "/")
+            with open(path, "rb") as file, self.metrics.phase("exports", "delivery"):
+                delivery.upload(s3, file.read(), s3_bucket, key)
+
+    def _s3(self):
+        if LOCAL_AWS_DIR:
+            from local_aws import LocalS3
+
+            return LocalS3(LOCAL_AWS_DIR)
+        return boto3.client("s3")
+
+    def _ses(self):
+        if LOCAL_AWS_DIR:
+            from local_aws import LocalSES
+
+            return LocalSES(LOCAL_AWS_DIR)
+        return boto3.client("ses", region_name=SES_REGION)
+
+    def deliver(self):
+        """Render the report into memory once and send that buffer to S3 and SES"""
+        buffer = io.BytesIO()
+        self.generate_excel(Output=buffer)
+        with self.metrics.phase("report", "delivery"):
+            self.send_report(buffer.getvalue())
+
+    def send_report(self, data):
+        import delivery
 
-    def send_s3(self):
-        # Time to deliver the file to S3
         s3_bucket = os.environ.get("S3_BUCKET")
+        ses_send = os.environ.get("SES_SEND")
+        ses_from = os.environ.get("SES_FROM")
+        s3 = None
         if s3_bucket:
             print(f"Sending to s3 {s3_bucket}...")
-            s3 = boto3.client("s3")
-            s3.upload_file(
-                self.report_name,
-                s3_bucket,
+            s3 = self._s3()
+            delivery.upload(s3, data, s3_bucket, self.report_name)
+        if ses_send and ses_from:
+            print(f"Sending email from {ses_from} to {ses_send}")
+            delivery.send_email(
+                self._ses(),
+                data,
                 self.report_name,
+                ses_from,
+                ses_send,
+                s3=s3,
+                bucket=s3_bucket,
+                key=self.report_name,
             )
 
+    def send_s3(self):
+        # Time to deliver the file to S3
+        s3_bucket = os.environ.get("S3_BUCKET")
+        if s3_bucket:
+            print(f"Sending to s3 {s3_bucket}...")
+            self._s3().upload_file(self.report_path, s3_bucket, self.report_name)
+
     def send_email(self):
+        import delivery
+
         ses_send = os.environ.get("SES_SEND")
         ses_from = os.environ.get("SES_FROM")
         if ses_send and ses_from:
-            # Email logic
             print(f"Sending email from {ses_from} to {ses_send}")
-            msg = MIMEMultipart()
-            msg["From"] = ses_from
-            msg["To"] = COMMASPACE.join(ses_send.split(","))
-            msg["Date"] = formatdate(localtime=True)
-            msg["Subject"] = "Cost Explorer Report"
-            text = "Find your Cost Explorer report attached\n\n"
-            msg.attach(MIMEText(text))
-            with open(self.report_name, "rb") as file:
-                part = MIMEApplication(file.read(), Name="cost_explorer_report.xlsx")
-            part["Content-Disposition"] = 'attachment; filename="%s"' % self.report_name
-            msg.attach(part)
-            # SES Sending
-            ses = boto3.client("ses", region_name=SES_REGION)
-            result = ses.send_raw_email(
-                Source=msg["From"],
-                Destinations=ses_send.split(","),
-                RawMessage={"Data": msg.as_string()},
+            with open(self.report_path, "rb") as file:
+                data = file.read()
+            s3_bucket = os.environ.get("S3_BUCKET")
+            delivery.send_email(
+                self._ses(),
+                data,
+                self.report_name,
+                ses_from,
+                ses_send,
+                s3=self._s3() if s3_bucket else None,
+                bucket=s3_bucket,
+                key=self.report_name,
             )
@@ -0,0 +1,98 @@
+"""
+Delivery
+
+Sends a report that is already rendered into memory to S3 and SES, without
+writing it to disk first. Large uploads go through S3 multipart transfers,
+attachments are zipped when that makes them noticeably smaller, and reports
+too big for SES are sent as a presigned S3 link instead.
+"""
+
+import io
+import os
+import zipfile
+
+# SES rejects raw messages above 10MB, after base64 encoding of attachments
+SES_MAX_MESSAGE_BYTES = int(os.getenv("SES_MAX_MESSAGE_BYTES", str(10 * 1024 * 1024)))
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))
+PRESIGNED_LINK_EXPIRY = int(os.getenv("PRESIGNED_LINK_EXPIRY", str(7 * 24 * 60 * 60)))
+
+
+def compress(name, data, min_saving=0.1):
+    """Zip data when that saves at least min_saving of its size.
+    Returns the (possibly new) attachment name and bytes.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(name, data)
+    zipped = buffer.getvalue()
+    if len(zipped) <= len(data) * (1 - min_saving):
+        return name + ".zip", zipped
+    return name, data
+
+
+def upload(s3, data, bucket, key):
+    """Upload bytes to S3, in parts once they pass S3_MULTIPART_THRESHOLD"""
+    from boto3.s3.transfer import TransferConfig
+
+    config = TransferConfig(
+        multipart_threshold=S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=S3_MULTIPART_THRESHOLD,
+    )
+    s3.upload_fileobj(io.BytesIO(data), bucket, key, Config=config)
+
+
+def presigned_link(s3, bucket, key, expires=PRESIGNED_LINK_EXPIRY):
+    return s3.generate_presigned_url(
+        "get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=expires
+    )
+
+
+def build_message(ses_from, ses_send, name=None, data=None, link=None):
+    """Report email with the report attached, or a download link to it"""
+    # Only loaded when SES is configured, S3 only runs never build an email
+    from email.mime.application import MIMEApplication
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email.utils import COMMASPACE, formatdate
+
+    msg = MIMEMultipart()
+    msg["From"] = ses_from
+    msg["To"] = COMMASPACE.join(ses_send.split(","))
+    msg["Date"] = formatdate(localtime=True)
+    msg["Subject"] = "Cost Explorer Report"
+    if link:
+        text = "Your Cost Explorer report is too large to attach, download it from\n"
+        text += "{}\n\n".format(link)
+        msg.attach(MIMEText(text))
+        return msg
+    text = "Find your Cost Explorer report attached\n\n"
+    msg.attach(MIMEText(text))
+    part = MIMEApplication(data, Name=name)
+    part["Content-Disposition"] = 'attachment; filename="%s"' % name
+    msg.attach(part)
+    return msg
+
+
+def send_email(ses, data, name, ses_from, ses_send, s3=None, bucket=None, key=None):
+    """Email the report, falling back to a presigned link of the S3 copy when
+    the message would exceed SES_MAX_MESSAGE_BYTES.
+    """
+    name, data = compress(name, data)
+    msg = build_message(ses_from, ses_send, name, data)
+    raw = msg.as_string()
+    if len(raw) > SES_MAX_MESSAGE_BYTES:
+        if not (s3 and bucket):
+            raise ValueError(
+                "Report email is {} bytes, above the SES limit, and there is no "
+                "S3_BUCKET to link to".format(len(raw))
+            )
+        print(f"Report too large to attach, linking to s3://{bucket}/{key}")
+        msg = build_message(
+            ses_from, ses_send, link=presigned_link(s3, bucket, key or name)
+        )
+        raw = msg.as_string()
+    return ses.send_raw_email(
+        Source=msg["From"],
+        Destinations=ses_send.split(","),
+        RawMessage={"Data": raw},
+    )
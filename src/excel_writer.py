@@ -0,0 +1,81 @@
+"""
+Excel Writer
+
+Writes report frames row by row with xlsxwriter's constant_memory mode, so
+only the current row of each sheet is held in memory. The layout matches
+DataFrame.to_excel (header row, index in the first column) so charts point
+at the same cell ranges in either mode.
+"""
+
+import xlsxwriter
+
+HEADER_FORMAT = {"bold": True, "border": 1}
+
+
+def _cell(value):
+    if hasattr(value, "item"):
+        value = value.item()  # numpy scalar
+    if isinstance(value, float) and value != value:
+        return None  # NaN, left blank like to_excel does
+    return value
+
+
+def write_sheet(workbook, name, df, header_format=None):
+    """Write df to a new worksheet, header row first then one row per index"""
+    worksheet = workbook.add_worksheet(name)
+    worksheet.write_row(0, 0, [""] + [_cell(c) for c in df.columns], header_format)
+    for row_num, row in enumerate(df.itertuples(name=None), start=1):
+        worksheet.write(row_num, 0, _cell(row[0]), header_format)
+        worksheet.write_row(row_num, 1, [_cell(v) for v in row[1:]])
+    return worksheet
+
+
+def add_chart(workbook, worksheet, name, df, denominator=False):
+    """Stacked column chart with a series per row, dates as categories"""
+    chart = workbook.add_chart({"type": "column", "subtype": "stacked"})
+
+    if denominator:
+        row_start = 2  # First row of unit cost reports is the volume
+    else:
+        row_start = 1
+
+    chartend = df.shape[1]
+    for row_num in range(row_start, len(df) + 1):
+        chart.add_series(
+            {
+                "name": [name, row_num, 0],
+                "categories": [name, 0, 1, 0, chartend],
+                "values": [name, row_num, 1, row_num, chartend],
+            }
+        )
+    chart.set_y_axis({"label_position": "low"})
+    chart.set_x_axis({"label_position": "low"})
+    worksheet.insert_chart("O2", chart, {"x_scale": 2.0, "y_scale": 2.0})
+
+
+def new_workbook(output, constant_memory=True):
+    """Workbook writing to output, a file path or a binary file object"""
+    return xlsxwriter.Workbook(output, {"constant_memory": constant_memory})
+
+
+def write_report(workbook, report, header_format=None):
+    """One sheet per report, with a chart for chart reports"""
+    print(report["Name"], report["Type"])
+    worksheet = write_sheet(workbook, report["Name"], report["Data"], header_format)
+    if report["Type"] == "chart":
+        add_chart(
+            workbook,
+            worksheet,
+            report["Name"],
+            report["Data"],
+            "Denominator" in report,
+        )
+
+
+def write_workbook(reports, output, constant_memory=True):
+    """Write reports to output, a file path or a binary file object"""
+    workbook = new_workbook(output, constant_memory)
+    header_format = workbook.add_format(HEADER_FORMAT)
+    for report in reports:
+        write_report(workbook, report, header_format)
+    workbook.close()
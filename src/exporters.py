@@ -0,0 +1,153 @@
+"""
+Exporters
+
+Writes the entries of CostExplorer.reports in other formats than the Excel
+workbook. Chart reports (groups x periods) are written in long form, one row
+per report, group and period, so they load into a warehouse with proper
+types. Table reports are written as they are.
+
+Parquet needs pyarrow, which is not part of the Lambda layer by default.
+"""
+
+import datetime
+import logging
+import os
+
+import pandas as pd
+
+
+def long_frame(report, df=None):
+    """report, group, period, value rows of a chart report, from df (groups x
+    periods) when given and from its Data otherwise
+    """
+    if df is None:
+        df = report["Data"]
+    periods = pd.to_datetime(pd.Series(df.columns), errors="coerce")
+    # Drops the derived "total" column, it is the sum of the periods
+    df = df.loc[:, periods.notna().to_numpy()]
+    df.columns = periods.dropna().dt.date
+    long = df.rename_axis(index="group", columns="period").stack().reset_index()
+    long.columns = ["group", "period", "value"]
+    long.insert(0, "report", report["Name"])
+    long["group"] = long["group"].astype(str)
+    long["value"] = long["value"].astype(float)
+    return long
+
+
+def table_frame(report):
+    df = report["Data"].copy()
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].astype(str)  # API values mix strings and numbers
+    df.insert(0, "report", report["Name"])
+    return df
+
+
+def export_frame(report):
+    if report["Type"] == "chart":
+        return long_frame(report)
+    return table_frame(report)
+
+
+class ExcelExporter:
+    extension = "xlsx"
+
+    def export(self, reports, directory, name, run_date):
+        from excel_writer import write_workbook
+
+        path = os.path.join(directory, name + ".xlsx")
+        write_workbook(reports, path)
+        return [path]
+
+
+class CsvExporter:
+    """One CSV per report: <directory>/csv/<date>/<report>.csv"""
+
+    extension = "csv"
+
+    def export(self, reports, directory, name, run_date):
+        folder = os.path.join(directory, "csv", run_date.isoformat())
+        os.makedirs(folder, exist_ok=True)
+        paths = []
+        for report in reports:
+            path = os.path.join(folder, report["Name"] + ".csv")
+            export_frame(report).to_csv(path, index=False)
+            paths.append(path)
+        return paths
+
+
+class ParquetExporter:
+    """Hive partitioned Parquet, chart reports by period and table reports by
+    run date:
+    <directory>/parquet/report=<report>/period=<period>/part-0.parquet
+    <directory>/parquet/report=<report>/date=<date>/part-0.parquet
+
+    Every run exports its whole window, so a period is written again by each
+    run covering it and its partition holds the values of the latest run
+    only, history read from the partitions counts each period once.
+
+    Periods are written from the raw periods x groups frame of a cost report
+    (report["Frame"], see CostExplorer.keep_frames), before Style and TopN: a
+    Change value or the groups folded into Other depend on the window of the
+    run. Styled chart reports without that frame are left out.
+    """
+
+    extension = "parquet"
+
+    def _write(self, directory, report, partition, df):
+        folder = os.path.join(
+            directory, "parquet", "report={}".format(report["Name"]), partition
+        )
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, "part-0.parquet")
+        df.to_parquet(path, index=False)
+        return path
+
+    def export(self, reports, directory, name, run_date):
+        paths = []
+        for report in reports:
+            if report["Type"] != "chart":
+                # The partition keys live in the path, not in the file
+                df = table_frame(report).drop(columns="report")
+                partition = "date={}".format(run_date.isoformat())
+                paths.append(self._write(directory, report, partition, df))
+                continue
+            if "Frame" in report:
+                df = long_frame(report, report["Frame"].T)
+            elif report.get("Style", "Total") == "Total":
+                df = long_frame(report)
+            else:
+                logging.warning(
+                    "%s is not exported to Parquet, it has no unstyled frame",
+                    report["Name"],
+                )
+                continue
+            df = df.drop(columns="report")
+            for period, rows in df.groupby("period", sort=True):
+                partition = "period={}".format(period.isoformat())
+                rows = rows.drop(columns="period")
+                paths.append(self._write(directory, report, partition, rows))
+        return paths
+
+
+EXPORTERS = {
+    "xlsx": ExcelExporter,
+    "csv": CsvExporter,
+    "parquet": ParquetExporter,
+}
+
+
+def export_reports(reports, formats, directory, name, run_date=None):
+    """Write reports in every format, returns the written paths"""
+    run_date = run_date or datetime.date.today()
+    paths = []
+    for export_format in formats:
+        if export_format not in EXPORTERS:
+            raise ValueError(
+                "Unknown export format {}, expected one of {}".format(
+                    export_format, list(EXPORTERS)
+                )
+            )
+        paths.extend(
+            EXPORTERS[export_format]().export(reports, directory, name, run_date)
+        )
+    return paths
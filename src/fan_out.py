@@ -0,0 +1,256 @@
+"""
+Fan Out
+
+Runs one report set for several payer (management) accounts in a single
+invocation. Each payer gets its own CostExplorer, with Cost Explorer and
+Organizations clients from a role assumed in that account, its own rate limit
+and its own caches, and the payers run concurrently on a thread pool.
+
+The payers' reports come back as one workbook: a consolidated roll-up first,
+the cost reports with the payers' periods x groups frames summed before
+Style and top N are applied once to the sum, then every report of every
+payer as "<payer> <report>". RI and unit cost reports are not consolidated.
+
+    PAYER_ACCOUNTS=111111111111=prod,222222222222=labs
+    PAYER_ROLE_NAME=CostExplorerReportRole
+"""
+
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pandas as pd
+
+from account_cache import (
+    ACCOUNT_CACHE_KEY,
+    ACCOUNT_CACHE_PATH,
+    AccountDirectory,
+)
+from change_styles import apply_style
+from cost_cache import COST_CACHE_KEY, COST_CACHE_PATH, CostCache
+from cost_explorer_report import ACCOUNT_LABEL, COST_CACHE, CostExplorer
+from history import (
+    REPORT_HISTORY,
+    REPORT_HISTORY_DIR,
+    REPORT_HISTORY_PREFIX,
+    History,
+)
+from ri_sweep import (
+    RECOMMENDATION_CACHE,
+    RECOMMENDATION_CACHE_KEY,
+    RECOMMENDATION_CACHE_PATH,
+    RecommendationCache,
+)
+from tag_cache import TAG_CACHE_KEY, TAG_CACHE_PATH, TagValueResolver
+from top_n import top_n
+
+# Payer account IDs, each optionally followed by =<name> for the sheet names
+PAYER_ACCOUNTS = os.getenv("PAYER_ACCOUNTS")
+PAYER_ROLE_NAME = os.getenv("PAYER_ROLE_NAME", "CostExplorerReportRole")
+PAYER_MAX_WORKERS = int(os.getenv("PAYER_MAX_WORKERS", "4"))
+# Excel sheet names are at most 31 characters, unique regardless of case and
+# without these characters
+SHEET_NAME_LENGTH = 31
+SHEET_NAME_INVALID = set("[]:*?/\\")
+
+
+def parse_accounts(value):
+    """ "111111111111=prod,222222222222" -> {account ID: name}"""
+    accounts = OrderedDict()
+    for entry in (value or "").split(","):
+        if not entry.strip():
+            continue
+        account_id, _, name = entry.strip().partition("=")
+        if not (account_id.isdigit() and len(account_id) == 12):
+            raise ValueError("Invalid payer account ID {}".format(account_id))
+        if SHEET_NAME_INVALID.intersection(name):
+            raise ValueError(
+                "Payer name {} contains one of {}, not allowed in sheet names".format(
+                    name, "".join(sorted(SHEET_NAME_INVALID))
+                )
+            )
+        accounts[account_id] = name or account_id
+    return accounts
+
+
+def session_clients(credentials):
+    """Cost Explorer and Organizations clients for assumed role credentials"""
+    session = boto3.session.Session(
+        aws_access_key_id=credentials["AccessKeyId"],
+        aws_secret_access_key=credentials["SecretAccessKey"],
+        aws_session_token=credentials["SessionToken"],
+    )
+    return (
+        session.client("ce", region_name="us-east-1"),
+        session.client("organizations"),
+    )
+
+
+def sheet_name(name, used):
+    """name cut to SHEET_NAME_LENGTH, with a ~2, ~3... suffix when that makes
+    it collide with a name in used (lower case, as Excel compares them)
+    """
+    candidate = name[:SHEET_NAME_LENGTH]
+    number = 1
+    while candidate.lower() in used:
+        number += 1
+        suffix = "~{}".format(number)
+        candidate = name[: SHEET_NAME_LENGTH - len(suffix)] + suffix
+    used.add(candidate.lower())
+    return candidate
+
+
+def _account_path(path, account_id):
+    """Cache file or S3 key of one payer, e.g. /tmp/cost_cache_<id>.sqlite"""
+    root, extension = os.path.splitext(path)
+    return "{}_{}{}".format(root, account_id, extension)
+
+
+def consolidate(reports):
+    """The same cost report of several payers, their periods x groups frames
+    summed, then Style and TopN applied to the sum. Returns the summed frame
+    and the report data.
+    """
+    df = pd.concat([report["Frame"] for report in reports]).fillna(0.0)
+    df = df.groupby(level=0, sort=True).sum()
+    df.index.name = "date"
+    report = reports[0]
+    return df, top_n(apply_style(df, report["Style"]).T, report["TopN"])
+
+
+class FanOut:
+    """Runs the reports planned by plan(costexplorer) for every payer
+    >>> fan_out = FanOut(plan_reports, accounts={"111111111111": "prod"})
+    >>> fan_out.run().output()
+
+    sts and clients replace the STS client and the function turning assumed
+    role credentials into (ce, organizations) clients, e.g. with LocalSTS and
+    local_clients of local_aws.py. A payer that fails is logged and left out
+    of the workbook, the run only fails when every payer does.
+    """
+
+    def __init__(
+        self,
+        plan,
+        accounts=None,
+        role_name=PAYER_ROLE_NAME,
+        max_workers=PAYER_MAX_WORKERS,
+        sts=None,
+        clients=session_clients,
+        costexplorer=None,
+    ):
+        self.plan = plan
+        self.accounts = parse_accounts(PAYER_ACCOUNTS) if accounts is None else accounts
+        if not self.accounts:
+            raise ValueError("No payer accounts to report on")
+        self.role_name = role_name
+        self.max_workers = max_workers
+        self.sts = sts
+        self.clients = clients
+        # Holds the merged reports and metrics, and writes the output
+        self.costexplorer = costexplorer or CostExplorer()
+
+    def credentials(self, account_id):
+        if self.sts is None:
+            self.sts = boto3.client("sts")
+        response = self.sts.assume_role(
+            RoleArn="arn:aws:iam::{}:role/{}".format(account_id, self.role_name),
+            RoleSessionName="cost-explorer-report",
+        )
+        return response["Credentials"]
+
+    def run_account(self, account_id):
+        """Plan and fetch the reports of one payer with its own clients"""
+        client, organizations = self.clients(self.credentials(account_id))
+        costexplorer = CostExplorer(
+            report_name=self.costexplorer.report_name,
+            client=client,
+            organizations=organizations,
+            cost_cache=False,
+            recommendation_cache=False,
+            history=False,
+        )
+        costexplorer.keep_frames = True
+        # Payers share query parameters and tag keys, never their results
+        if COST_CACHE:
+            costexplorer.cost_cache = CostCache(
+                path=_account_path(COST_CACHE_PATH, account_id),
+                key=_account_path(COST_CACHE_KEY, account_id),
+            )
+        if RECOMMENDATION_CACHE:
+            costexplorer.recommendation_cache = RecommendationCache(
+                path=_account_path(RECOMMENDATION_CACHE_PATH, account_id),
+                key=_account_path(RECOMMENDATION_CACHE_KEY, account_id),
+            )
+        if REPORT_HISTORY:
+            costexplorer.history = History(
+                directory=os.path.join(REPORT_HISTORY_DIR, account_id),
+                prefix="{}{}/".format(REPORT_HISTORY_PREFIX, account_id),
+            )
+        costexplorer.tags = TagValueResolver(
+            costexplorer.tags.fetch,
+            path=_account_path(TAG_CACHE_PATH, account_id),
+            key=_account_path(TAG_CACHE_KEY, account_id),
+        )
+        costexplorer.accounts = AccountDirectory(
+            label=ACCOUNT_LABEL,
+            path=_account_path(ACCOUNT_CACHE_PATH, account_id),
+            key=_account_path(ACCOUNT_CACHE_KEY, account_id),
+            client=organizations,
+        )
+        self.plan(costexplorer)
+        costexplorer.run_planned_reports()
+        return costexplorer
+
+    def run(self):
+        """Run every payer, returns the CostExplorer holding the merged reports"""
+        workers = max(1, min(self.max_workers, len(self.accounts)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = OrderedDict(
+                (account_id, pool.submit(self.run_account, account_id))
+                for account_id in self.accounts
+            )
+        payers = OrderedDict()
+        error = None
+        for account_id, future in futures.items():
+            try:
+                payers[account_id] = future.result()
+            except Exception as e:
+                logging.exception("Reports for payer %s failed", account_id)
+                self.costexplorer.metrics.add("run", "failed_payers", 1)
+                error = e
+        if not payers:
+            raise error
+        self.merge(payers)
+        return self.costexplorer
+
+    def merge(self, payers):
+        """Consolidated reports followed by every payer's reports"""
+        metrics = self.costexplorer.metrics
+        by_name = OrderedDict()
+        for account_id, costexplorer in payers.items():
+            name = self.accounts[account_id]
+            for report in costexplorer.reports:
+                by_name.setdefault(report["Name"], []).append(report)
+            for report, stats in costexplorer.metrics.reports.items():
+                for stat, value in stats.items():
+                    metrics.add("{} {}".format(name, report), stat, value)
+        consolidated = []
+        for name, reports in by_name.items():
+            if len(reports) != len(payers) or any(
+                "Frame" not in report for report in reports
+            ):
+                continue
+            with metrics.phase(name, "processing"):
+                frame, df = consolidate(reports)
+            consolidated.append(dict(reports[0], Frame=frame, Data=df))
+        # Long payer names can cut "<payer> <report>" to the same sheet name
+        used = set(report["Name"].lower() for report in consolidated)
+        sheets = []
+        for account_id, costexplorer in payers.items():
+            for report in costexplorer.reports:
+                name = "{} {}".format(self.accounts[account_id], report["Name"])
+                sheets.append(dict(report, Name=sheet_name(name, used)))
+        self.costexplorer.reports = consolidated + sheets
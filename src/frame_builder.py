@@ -0,0 +1,148 @@
+"""
+Frame Builder
+
+Accumulates get_cost_and_usage ResultsByTime entries straight into a NumPy
+array, one row per period and one column per group key, instead of building
+a dict per period and letting pandas align them. Every metric of the request
+gets its own layer of the array, sharing the same rows and columns. The
+entries of a period whose groups span several pages add up in its one row.
+
+With max_groups, once that many groups are held the half with the smallest
+spend so far is folded into a single OTHER column, and later amounts of
+folded groups are added to it, so memory stays bounded for any group count.
+"""
+
+import numpy as np
+import pandas as pd
+
+from top_n import OTHER
+
+
+class CostFrameBuilder:
+    """Builds the date x group frame of each metric
+    >>> builder = CostFrameBuilder(["UnblendedCost"], rows=30)
+    >>> for result in results:
+    ...     builder.add(result)
+    >>> df = builder.frame("UnblendedCost")
+    """
+
+    def __init__(
+        self,
+        metrics=("UnblendedCost",),
+        rows=32,
+        columns=16,
+        key_label=None,
+        max_groups=None,
+    ):
+        self.metrics = list(metrics)
+        self.key_label = key_label
+        self.max_groups = max_groups
+        # group key -> column, folded groups all point at the OTHER column
+        self.columns = {}
+        self.names = []
+        # period start -> row, a period can span several result pages
+        self.rows = {}
+        self.dates = []
+        self.values = np.zeros((len(self.metrics), max(rows, 1), max(columns, 1)))
+
+    def _new_column(self, key):
+        column = self.columns[key] = len(self.names)
+        self.names.append(key)
+        if column >= self.values.shape[2]:
+            self._grow(columns=self.values.shape[2] * 2)
+        return column
+
+    def _fold(self):
+        """Fold the smaller half of the groups (by spend so far) into OTHER"""
+        held = len(self.names)
+        spend = np.abs(self.values[0, :, :held]).sum(axis=0)
+        if OTHER in self.columns:
+            spend[self.columns[OTHER]] = np.inf  # kept, it is the target
+        keep = np.sort(np.argsort(-spend, kind="stable")[: self.max_groups // 2])
+        folded = np.ones(held, dtype=bool)
+        folded[keep] = False
+        other = self.values[:, :, :held][:, :, folded].sum(axis=2)
+        values = np.zeros_like(self.values)
+        values[:, :, : len(keep)] = self.values[:, :, keep]
+        remap = {old: new for new, old in enumerate(keep)}
+        names = [self.names[old] for old in keep]
+        if OTHER not in names:
+            names.append(OTHER)
+        other_column = names.index(OTHER)
+        values[:, :, other_column] += other
+        self.columns = {
+            key: remap.get(column, other_column) for key, column in self.columns.items()
+        }
+        self.columns[OTHER] = other_column
+        self.names = names
+        self.values = values
+
+    def _grow(self, rows=None, columns=None):
+        _, old_rows, old_columns = self.values.shape
+        values = np.zeros((len(self.metrics), rows or old_rows, columns or old_columns))
+        values[:, :old_rows, :old_columns] = self.values
+        self.values = values
+
+    def _row(self, date):
+        row = self.rows.get(date)
+        if row is None:
+            row = self.rows[date] = len(self.dates)
+            if row >= self.values.shape[1]:
+                self._grow(rows=self.values.shape[1] * 2)
+            self.dates.append(date)
+        return row
+
+    def _amounts(self, result):
+        """Group keys of a result and their (metrics, groups) amounts, every
+        metric parsed in the same pass
+        """
+        metrics = self.metrics
+        groups = result["Groups"]
+        if not groups:
+            total = result["Total"]
+            return ["Total"], np.array(
+                [[total[metric]["Amount"]] for metric in metrics], dtype=float
+            )
+        keys = [group["Keys"][0] for group in groups]
+        if self.key_label:
+            keys = [self.key_label(key) for key in keys]
+        amounts = [
+            [group["Metrics"][metric]["Amount"] for group in groups]
+            for metric in metrics
+        ]
+        return keys, np.array(amounts, dtype=float)
+
+    def _write(self, row, columns, amounts):
+        # Added, keys can share a column (folded groups share the OTHER one)
+        np.add.at(self.values[:, row], (slice(None), columns), amounts)
+
+    def add(self, result):
+        row = self._row(result["TimePeriod"]["Start"])
+        keys, amounts = self._amounts(result)
+        columns = [self.columns.get(key) for key in keys]
+        done = 0
+        if None in columns:
+            # New groups, resolved one at a time since each one may fold
+            # (and renumber) the others, the amounts before a fold are
+            # written first so it goes by the spend so far
+            for i, key in enumerate(keys):
+                column = self.columns.get(key)
+                if column is None:
+                    if self.max_groups and len(self.names) >= self.max_groups:
+                        self._write(row, columns[done:i], amounts[:, done:i])
+                        done = i
+                        self._fold()
+                    column = self._new_column(key)
+                columns[i] = column
+        self._write(row, columns[done:], amounts[:, done:])
+
+    def frame(self, metric=None):
+        """The periods x groups DataFrame of metric (default the first one),
+        groups in order of first appearance
+        """
+        layer = self.metrics.index(metric) if metric else 0
+        return pd.DataFrame(
+            self.values[layer, : len(self.dates), : len(self.names)],
+            index=pd.Index(self.dates, name="date"),
+            columns=list(self.names),
+        )
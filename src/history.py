@@ -0,0 +1,162 @@
+"""
+History
+
+An archive of the raw cost report frames, periods x groups before Style and
+top N are applied, one Parquet file per query and metric in a local
+directory or under a prefix in S3. With REPORT_HISTORY a report only asks
+Cost Explorer for the periods from the first one missing in the archive,
+appends them to the archived periods of its window and applies Style
+(Change rows...), totals and top N to the whole window again. Longer windows
+then cost a few periods per run instead of the whole window.
+
+Like the cost cache, only finalized periods are archived, the last
+COST_CACHE_MUTABLE_DAYS are fetched on every run. Parquet needs pyarrow.
+"""
+
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+
+import boto3
+import pandas as pd
+from botocore.exceptions import ClientError
+from dateutil.relativedelta import relativedelta
+
+from cost_cache import COST_CACHE_MUTABLE_DAYS, periods, to_date
+
+REPORT_HISTORY = os.getenv("REPORT_HISTORY", "false")
+if REPORT_HISTORY == "true":
+    REPORT_HISTORY = True
+else:
+    REPORT_HISTORY = False
+REPORT_HISTORY_DIR = os.getenv("REPORT_HISTORY_DIR", "/tmp/history")
+REPORT_HISTORY_BUCKET = os.getenv("REPORT_HISTORY_BUCKET")
+REPORT_HISTORY_PREFIX = os.getenv("REPORT_HISTORY_PREFIX", "history/")
+
+
+class History:
+    """Archived periods of each cost query
+    >>> history = History()
+    >>> archived = history.load(params, "UnblendedCost")
+    >>> fetch_params = history.fetch_params(params, [archived])
+    >>> df = history.extend(params, "UnblendedCost", archived, fetched_frame)
+    """
+
+    GRANULARITIES = ("DAILY", "MONTHLY")
+
+    def __init__(
+        self,
+        directory=REPORT_HISTORY_DIR,
+        bucket=REPORT_HISTORY_BUCKET,
+        prefix=REPORT_HISTORY_PREFIX,
+        mutable_days=COST_CACHE_MUTABLE_DAYS,
+    ):
+        self.directory = directory
+        self.bucket = bucket
+        self.prefix = prefix
+        self.mutable_days = mutable_days
+        # Archives read and written this run, reports sharing a query share them
+        self.loaded = {}
+        self.saved = set()
+
+    def name(self, params, metric):
+        """File name of a query and metric, the report window is not part of it"""
+        query = json.dumps(
+            {k: v for k, v in params.items() if k != "TimePeriod"}, sort_keys=True
+        )
+        digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+        return "{}-{}.parquet".format(digest, metric)
+
+    def load(self, params, metric):
+        """Archived periods x groups frame, None when there is none yet"""
+        name = self.name(params, metric)
+        if name not in self.loaded:
+            self.loaded[name] = self._read(name)
+        return self.loaded[name]
+
+    def _read(self, name):
+        if self.bucket:
+            try:
+                body = boto3.client("s3").get_object(
+                    Bucket=self.bucket, Key=self.prefix + name
+                )
+            except ClientError:
+                logging.info("No history in s3://%s/%s yet", self.bucket, name)
+                return None
+            return pd.read_parquet(io.BytesIO(body["Body"].read()))
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path)
+
+    def _write(self, name, df):
+        if self.bucket:
+            buffer = io.BytesIO()
+            df.to_parquet(buffer)
+            boto3.client("s3").put_object(
+                Bucket=self.bucket, Key=self.prefix + name, Body=buffer.getvalue()
+            )
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        df.to_parquet(os.path.join(self.directory, name))
+
+    def fetch_params(self, params, archives):
+        """params with TimePeriod starting at the first period of the window
+        missing from any of the archives
+        """
+        start = to_date(params["TimePeriod"]["Start"])
+        end = to_date(params["TimePeriod"]["End"])
+        wanted = [p.isoformat() for p in periods(start, end, params["Granularity"])]
+        if not wanted:
+            return params
+        first = len(wanted) - 1  # the last period is always fetched
+        for archived in archives:
+            have = set(archived.index) if archived is not None else set()
+            missing = [i for i, period in enumerate(wanted) if period not in have]
+            first = min([first] + missing[:1])
+        fetch = dict(params)
+        fetch["TimePeriod"] = {"Start": wanted[first], "End": end.isoformat()}
+        return fetch
+
+    def _final(self, dates, granularity):
+        cutoff = datetime.date.today() - datetime.timedelta(days=self.mutable_days)
+        step = relativedelta(months=+1) if granularity == "MONTHLY" else None
+        final = []
+        for date in dates:
+            start = to_date(date)
+            if step:
+                end = (start + step).replace(day=1)
+            else:
+                end = start + datetime.timedelta(days=1)
+            final.append(end <= cutoff)
+        return final
+
+    def extend(self, params, metric, archived, fetched):
+        """Window frame of archived periods followed by the fetched ones,
+        the finalized periods of both are archived again
+        """
+        df = fetched
+        if archived is not None:
+            window = params["TimePeriod"]
+            dates = archived.index
+            before = archived[
+                (dates >= window["Start"])
+                & (dates < window["End"])
+                & ~dates.isin(fetched.index)
+            ]
+            df = pd.concat([before, fetched]).fillna(0.0).sort_index()
+            df.index.name = fetched.index.name
+        name = self.name(params, metric)
+        if name not in self.saved:
+            self.saved.add(name)
+            keep = fetched[self._final(fetched.index, params["Granularity"])]
+            if archived is not None:
+                rest = archived[~archived.index.isin(keep.index)]
+                keep = pd.concat([rest, keep]).fillna(0.0).sort_index()
+            # Groups as strings, Parquet needs string column names
+            keep.columns = [str(column) for column in keep.columns]
+            self._write(name, keep)
+        return df
@@ -0,0 +1,169 @@
+"""
+Instrumentation
+
+Per report counters and timings for a run: Cost Explorer requests, pages and
+bytes received, and time spent waiting on the rate limit, on the network, in
+the database, in pandas and rendering the workbook. Phases nest, each one is
+charged only the time not spent in the phases inside it, so a streamed report
+splits into network and processing time.
+
+Peak memory (ru_maxrss) is a process wide high water mark, reports run
+concurrently and share it, so it is only part of the run line.
+
+emit() prints one JSON line per report and one for the run. With METRICS_EMF
+the lines also carry CloudWatch Embedded Metric Format metadata, so Lambda
+logs turn into CloudWatch metrics without any API calls.
+"""
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+METRICS_EMF = os.getenv("METRICS_EMF", "false")
+if METRICS_EMF == "true":
+    METRICS_EMF = True
+else:
+    METRICS_EMF = False
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "CostExplorerReport")
+
+UNITS = {
+    "api_calls": "Count",
+    "pages": "Count",
+    "throttled": "Count",
+    "failed_payers": "Count",
+    "bytes": "Bytes",
+    "peak_rss_mb": "Megabytes",
+}
+
+
+def unit(name):
+    return "Seconds" if name.endswith("_s") else UNITS.get(name, "None")
+
+
+def peak_rss_mb():
+    """High water mark of the process memory so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def response_bytes(response):
+    """Body size of a boto3 response from its Content-Length, 0 when there
+    are no HTTP headers (e.g. the synthetic clients of local_aws.py).
+    Serializing the response again to measure it would cost more than it
+    took to parse.
+    """
+    headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    return int(headers.get("content-length", 0))
+
+
+class Instrumentation:
+    """Collects metrics per report, safe to use from the planner's threads
+    >>> metrics = Instrumentation()
+    >>> with metrics.phase("Services", "processing"):
+    ...     build_report()
+    >>> metrics.emit()
+    """
+
+    def __init__(self, emf=METRICS_EMF, namespace=METRICS_NAMESPACE):
+        self.emf = emf
+        self.namespace = namespace
+        self.reports = OrderedDict()
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def add(self, report, name, value):
+        with self.lock:
+            stats = self.reports.setdefault(report, OrderedDict())
+            stats[name] = stats.get(name, 0) + value
+
+    def current(self):
+        """Report of the innermost phase on this thread"""
+        stack = self._stack()
+        return stack[-1][0] if stack else "run"
+
+    @contextmanager
+    def phase(self, report, name):
+        stack = self._stack()
+        # report, phase, start, time spent in nested phases
+        frame = [report, name, time.perf_counter(), 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            # A generator closed late may not be the innermost phase any more
+            index = [id(f) for f in stack].index(id(frame))
+            del stack[index]
+            elapsed = time.perf_counter() - frame[2]
+            self.add(report, name + "_s", elapsed - frame[3])
+            if index:
+                stack[index - 1][3] += elapsed
+
+    def request(self, fn):
+        """Wrap an API call so each attempt is counted and timed as network"""
+
+        def call(**kwargs):
+            report = self.current()
+            self.add(report, "api_calls", 1)
+            with self.phase(report, "network"):
+                response = fn(**kwargs)
+            self.add(report, "pages", 1)
+            self.add(report, "bytes", response_bytes(response))
+            return response
+
+        return call
+
+    def summary(self):
+        """Totals over every report plus the run duration and peak memory"""
+        totals = OrderedDict()
+        for stats in self.reports.values():
+            for name, value in stats.items():
+                totals[name] = totals.get(name, 0) + value
+        totals["throttled"] = totals.get("api_calls", 0) - totals.get("pages", 0)
+        totals["duration_s"] = time.perf_counter() - self.started
+        totals["peak_rss_mb"] = peak_rss_mb()
+        return totals
+
+    def _record(self, event, dimensions, stats):
+        record = OrderedDict([("event", event)])
+        record.update(dimensions)
+        for name, value in stats.items():
+            record[name] = round(value, 4) if isinstance(value, float) else value
+        if self.emf:
+            record["_aws"] = {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [list(dimensions)],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit(name)} for name in stats
+                        ],
+                    }
+                ],
+            }
+        return record
+
+    def records(self):
+        for report, stats in self.reports.items():
+            stats = OrderedDict(stats)
+            # Attempts without a page are the throttled (or failed) requests
+            stats["throttled"] = stats.get("api_calls", 0) - stats.get("pages", 0)
+            yield self._record("report_metrics", {"Report": report}, stats)
+        yield self._record("run_metrics", {"Run": "main_handler"}, self.summary())
+
+    def emit(self, stream=None):
+        """Print the metrics as JSON lines, one per report and one for the run"""
+        for record in self.records():
+            print(json.dumps(record), file=stream or sys.stdout)
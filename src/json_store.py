@@ -0,0 +1,54 @@
+"""
+JSON Store
+
+One JSON document kept in a local file or, when a bucket is set, as an S3
+object. The account, tag value and recommendation caches keep their state in
+one each, and a Lambda keeps it between runs with the bucket.
+"""
+
+import json
+import logging
+import os
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+class JsonStore:
+    """A JSON document in a file or S3 object, None until it is written
+    >>> store = JsonStore("/tmp/tag_values.json", bucket, "cache/tag_values.json")
+    >>> cache = store.read() or {}
+    >>> store.write(cache)
+
+    path=None and bucket=None keep nothing, e.g. for an in memory cache.
+    """
+
+    def __init__(self, path, bucket=None, key=None, name="cache"):
+        self.path = path
+        self.bucket = bucket
+        self.key = key
+        # For the log line when the document does not exist yet
+        self.name = name
+
+    def read(self):
+        if self.bucket:
+            try:
+                body = boto3.client("s3").get_object(Bucket=self.bucket, Key=self.key)
+            except ClientError:
+                logging.info(
+                    "No %s in s3://%s/%s yet", self.name, self.bucket, self.key
+                )
+                return None
+            return json.loads(body["Body"].read())
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as file:
+                return json.load(file)
+        return None
+
+    def write(self, document):
+        body = json.dumps(document, default=str)
+        if self.bucket:
+            boto3.client("s3").put_object(Bucket=self.bucket, Key=self.key, Body=body)
+        elif self.path:
+            with open(self.path, "w") as file:
+                file.write(body)
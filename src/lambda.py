@@ -2,42 +2,59 @@ import os
 
 from cost_explorer_report import CostExplorer
 
+# Reports described in a YAML / JSON file instead, see report_spec.py
+REPORT_SPEC = os.getenv("REPORT_SPEC")
+# One report set per payer account in the same workbook, see fan_out.py
+PAYER_ACCOUNTS = os.getenv("PAYER_ACCOUNTS")
+
 
 def main_handler(event=None, context=None):
     print("In main_handler")
+    if REPORT_SPEC:
+        from report_spec import load_spec, run_spec
+
+        run_spec(load_spec(REPORT_SPEC))
+        return
+    if PAYER_ACCOUNTS:
+        from fan_out import FanOut
+
+        FanOut(plan_reports).run().output()
+        return
     costexplorer = CostExplorer()
+    plan_reports(costexplorer)
+    costexplorer.run_planned_reports()
+    costexplorer.output()
+
+
+def plan_reports(costexplorer):
+    # Reports are planned first so reports sharing a query cost one API call,
+    # and independent queries are fetched concurrently
     # Default addReport has filter to remove Support / Credits / Refunds / UpfrontRI
     # Overall Billing Reports
-    costexplorer.add_report(Name="Total", GroupBy=[], Style="Total", IncSupport=True)
-    costexplorer.add_report(Name="TotalChange", GroupBy=[], Style="Change")
-    costexplorer.add_report(
+    costexplorer.plan_report(Name="Total", GroupBy=[], Style="Total", IncSupport=True)
+    costexplorer.plan_report(Name="TotalChange", GroupBy=[], Style="Change")
+    costexplorer.plan_report(
        Name="TotalInclCredits",
        GroupBy=[],
        Style="Total",
        NoCredits=False,
        IncSupport=True,
     )
-    costexplorer.add_report(
+    costexplorer.plan_report(
         Name="Services",
         GroupBy=[{"Type": "DIMENSION", "Key": "SERVICE"}],
         Style="Total",
         IncSupport=True,
     )
-    costexplorer.add_per_dog_report()
-    costexplorer.add_report(
+    costexplorer.plan_report(
         Name="ServicesChange",
         GroupBy=[{"Type": "DIMENSION", "Key": "SERVICE"}],
         Style="Change",
     )
-    costexplorer.add_report(
+    costexplorer.plan_report(
         Name="Regions", GroupBy=[{"Type": "DIMENSION", "Key": "REGION"}], Style="Total"
     )
-    costexplorer.generate_excel()
-    if os.environ.get("S3_BUCKET"):
-        costexplorer.send_s3()
-    if os.environ.get("SES_SEND"):
-        costexplorer.send_email()
-    print("Report generated")
+    costexplorer.plan_per_dog_report()
 
 
 if __name__ == "__main__":
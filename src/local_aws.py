@@ -0,0 +1,389 @@
+"""
+Local AWS
+
+Directory backed stand-ins for the S3 and SES clients used by the report, so
+delivery can be run and checked without an AWS account. Objects are written
+to <root>/s3/<bucket>/<key> and emails to <root>/ses/<n>.eml.
+
+LocalCostExplorer and LocalOrganizations answer with synthetic data of a
+configurable size, RecordingClient / ReplayClient save real responses to a
+JSON fixture and play them back, so reports can be built and benchmarked
+offline. LocalSTS and local_clients stand in for the assumed roles of a
+multi payer run (fan_out.py). Every client counts its calls per operation in
+.calls.
+"""
+
+import collections
+import datetime
+import json
+import os
+import random
+import shutil
+
+from botocore.exceptions import ClientError
+
+
+class LocalS3:
+    """The subset of the boto3 S3 client used by the report"""
+
+    def __init__(self, root):
+        self.root = os.path.join(root, "s3")
+
+    def _path(self, bucket, key):
+        path = os.path.join(self.root, bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def _missing(self, operation, bucket, key):
+        return ClientError(
+            {"Error": {"Code": "NoSuchKey", "Message": "{}/{}".format(bucket, key)}},
+            operation,
+        )
+
+    def upload_fileobj(self, fileobj, bucket, key, **kwargs):
+        with open(self._path(bucket, key), "wb") as file:
+            shutil.copyfileobj(fileobj, file)
+
+    def upload_file(self, filename, bucket, key, **kwargs):
+        shutil.copyfile(filename, self._path(bucket, key))
+
+    def download_file(self, bucket, key, filename, **kwargs):
+        path = self._path(bucket, key)
+        if not os.path.exists(path):
+            raise self._missing("HeadObject", bucket, key)
+        shutil.copyfile(path, filename)
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        with open(self._path(Bucket, Key), "wb") as file:
+            file.write(Body if isinstance(Body, bytes) else Body.read())
+        return {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise self._missing("GetObject", Bucket, Key)
+        return {"Body": open(path, "rb")}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return "file://" + self._path(Params["Bucket"], Params["Key"])
+
+
+class LocalSES:
+    """Writes raw emails to disk instead of sending them"""
+
+    def __init__(self, root):
+        self.root = os.path.join(root, "ses")
+        os.makedirs(self.root, exist_ok=True)
+
+    def send_raw_email(self, Source, Destinations, RawMessage, **kwargs):
+        message_id = str(len(os.listdir(self.root)))
+        with open(os.path.join(self.root, message_id + ".eml"), "w") as file:
+            file.write(RawMessage["Data"])
+        return {"MessageId": message_id}
+
+
+def _params_key(operation, params):
+    return json.dumps([operation, params], sort_keys=True, default=str)
+
+
+def _periods(time_period, granularity):
+    start = datetime.datetime.strptime(time_period["Start"], "%Y-%m-%d").date()
+    end = datetime.datetime.strptime(time_period["End"], "%Y-%m-%d").date()
+    while start < end:
+        if granularity == "MONTHLY":
+            following = (start.replace(day=1) + datetime.timedelta(days=32)).replace(
+                day=1
+            )
+        else:
+            following = start + datetime.timedelta(days=1)
+        following = min(following, end)
+        yield {"Start": start.isoformat(), "End": following.isoformat()}
+        start = following
+
+
+# InstanceDetails entry of each service's recommendations
+RECOMMENDATION_DETAILS = {
+    "Amazon Relational Database Service": "RDSInstanceDetails",
+    "Amazon ElastiCache": "ElastiCacheInstanceDetails",
+    "Amazon Redshift": "RedshiftInstanceDetails",
+    "Amazon OpenSearch Service": "ESInstanceDetails",
+}
+
+
+class LocalCostExplorer:
+    """Synthetic Cost Explorer client, groups per period and page_size
+    periods per page. Amounts are random but the same for the same seed.
+    >>> ce = LocalCostExplorer(groups=50, page_size=30)
+    >>> costexplorer = CostExplorer(client=ce)
+    """
+
+    def __init__(self, groups=10, page_size=None, seed=0, accounts=None):
+        self.groups = groups
+        self.page_size = page_size
+        self.seed = seed
+        self.accounts = accounts or LocalOrganizations().account_ids()
+        self.calls = collections.Counter()
+
+    def _random(self, *key):
+        return random.Random(repr((self.seed,) + key))
+
+    def _amount(self, *key):
+        return "{:.10f}".format(self._random(*key).random() * 100)
+
+    def _key(self, dimension, group):
+        if dimension == "LINKED_ACCOUNT":
+            return self.accounts[group % len(self.accounts)]
+        return "{}-{}".format(dimension, group)
+
+    def _page(self, result_key, items, kwargs, build=None):
+        """Response page of items, only the items on the page are built"""
+        items = list(items)
+        start = int(kwargs.get("NextPageToken") or 0)
+        end = start + self.page_size if self.page_size else len(items)
+        response = {
+            result_key: [build(item) if build else item for item in items[start:end]]
+        }
+        if end < len(items):
+            response["NextPageToken"] = str(end)
+        return response
+
+    def get_cost_and_usage(self, **kwargs):
+        self.calls["get_cost_and_usage"] += 1
+        group_by = kwargs.get("GroupBy") or []
+        metrics = kwargs["Metrics"]
+
+        def result(period):
+            rng = self._random(period["Start"], repr(group_by))
+            groups = []
+            for group in range(self.groups if group_by else 0):
+                groups.append(
+                    {
+                        "Keys": [self._key(g["Key"], group) for g in group_by],
+                        "Metrics": {
+                            metric: {
+                                "Amount": "{:.10f}".format(rng.random() * 100),
+                                "Unit": "USD",
+                            }
+                            for metric in metrics
+                        },
+                    }
+                )
+            total = {}
+            if not group_by:
+                total = {
+                    metric: {"Amount": "{:.10f}".format(rng.random() * 100)}
+                    for metric in metrics
+                }
+            return {
+                "TimePeriod": period,
+                "Total": total,
+                "Groups": groups,
+                "Estimated": False,
+            }
+
+        periods = _periods(kwargs["TimePeriod"], kwargs["Granularity"])
+        return self._page("ResultsByTime", periods, kwargs, result)
+
+    def get_tags(self, **kwargs):
+        self.calls["get_tags"] += 1
+        tags = ["tag-{}".format(group) for group in range(self.groups)]
+        return self._page("Tags", tags, kwargs)
+
+    def get_reservation_coverage(self, **kwargs):
+        self.calls["get_reservation_coverage"] += 1
+        results = []
+        for period in _periods(kwargs["TimePeriod"], kwargs["Granularity"]):
+            percentage = self._amount(period["Start"], "coverage")
+            hours = {"CoverageHours": {"CoverageHoursPercentage": percentage}}
+            results.append({"TimePeriod": period, "Total": hours, "Groups": []})
+        return self._page("CoveragesByTime", results, kwargs)
+
+    def get_reservation_utilization(self, **kwargs):
+        self.calls["get_reservation_utilization"] += 1
+        results = []
+        for period in _periods(kwargs["TimePeriod"], kwargs["Granularity"]):
+            total = {
+                "UtilizationPercentage": self._amount(period["Start"], "utilization"),
+                "NetRISavings": self._amount(period["Start"], "savings"),
+            }
+            results.append({"TimePeriod": period, "Total": total, "Groups": []})
+        return self._page("UtilizationsByTime", results, kwargs)
+
+    def get_reservation_purchase_recommendation(self, **kwargs):
+        self.calls["get_reservation_purchase_recommendation"] += 1
+        service = kwargs["Service"]
+        term = kwargs.get("TermInYears", "ONE_YEAR")
+        details = []
+        for group in range(self.groups):
+            amount = self._amount(service, kwargs["PaymentOption"], term, group)
+            details.append(
+                {
+                    "AccountId": self.accounts[group % len(self.accounts)],
+                    "InstanceDetails": {
+                        RECOMMENDATION_DETAILS.get(service, "EC2InstanceDetails"): {
+                            "InstanceType": "m5.{}xlarge".format(group + 1),
+                            "Region": "us-east-1",
+                        }
+                    },
+                    "RecommendedNumberOfInstancesToPurchase": str(group % 4 + 1),
+                    "MinimumNumberOfInstancesUsedPerHour": "1",
+                    "MaximumNumberOfInstancesUsedPerHour": str(group % 4 + 2),
+                    "EstimatedMonthlySavingsAmount": amount,
+                    "EstimatedMonthlyOnDemandCost": "{:.2f}".format(float(amount) * 3),
+                    "EstimatedBreakEvenInMonths": "4",
+                    "UpfrontCost": "0",
+                    "RecurringStandardMonthlyCost": amount,
+                }
+            )
+        return self._page(
+            "Recommendations", [{"RecommendationDetails": details}], kwargs
+        )
+
+
+class _AccountsPaginator:
+    def __init__(self, organizations, page_size):
+        self.organizations = organizations
+        self.page_size = page_size
+
+    def paginate(self, **kwargs):
+        accounts = self.organizations.accounts
+        for start in range(0, len(accounts), self.page_size):
+            self.organizations.calls["list_accounts"] += 1
+            yield {"Accounts": accounts[start : start + self.page_size]}
+
+
+class LocalOrganizations:
+    """Synthetic Organizations client with n_accounts member accounts"""
+
+    class exceptions:
+        class AWSOrganizationsNotInUseException(Exception):
+            pass
+
+    def __init__(self, n_accounts=20, page_size=20):
+        self.accounts = [
+            {
+                "Id": "{:012d}".format(100000000000 + number),
+                "Name": "account-{}".format(number),
+                "Email": "account-{}@example.com".format(number),
+            }
+            for number in range(n_accounts)
+        ]
+        self.page_size = page_size
+        self.calls = collections.Counter()
+
+    def account_ids(self):
+        return [account["Id"] for account in self.accounts]
+
+    def get_paginator(self, operation):
+        return _AccountsPaginator(self, self.page_size)
+
+
+class LocalSTS:
+    """assume_role stand-in, the credentials name the account of the role"""
+
+    def __init__(self):
+        self.roles = []
+        self.calls = collections.Counter()
+
+    def assume_role(self, RoleArn, RoleSessionName, **kwargs):
+        self.calls["assume_role"] += 1
+        self.roles.append(RoleArn)
+        account_id = RoleArn.split(":")[4]
+        expiration = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        return {
+            "Credentials": {
+                "AccessKeyId": "LOCAL" + account_id,
+                "SecretAccessKey": "local",
+                "SessionToken": "local",
+                "Expiration": expiration,
+            },
+            "AssumedRoleUser": {
+                "Arn": "{}/{}".format(RoleArn, RoleSessionName),
+                "AssumedRoleId": "LOCAL:" + RoleSessionName,
+            },
+        }
+
+
+def local_clients(credentials, groups=10, page_size=None):
+    """Synthetic (ce, organizations) clients for LocalSTS credentials, each
+    account gets its own amounts
+    >>> FanOut(plan, sts=LocalSTS(), clients=local_clients).run()
+    """
+    account_id = credentials["AccessKeyId"][len("LOCAL") :]
+    organizations = LocalOrganizations()
+    ce = LocalCostExplorer(
+        groups=groups,
+        page_size=page_size,
+        seed=account_id,
+        accounts=organizations.account_ids(),
+    )
+    return ce, organizations
+
+
+class RecordingClient:
+    """Passes calls through to client and keeps every response, save() writes
+    them to a JSON fixture for ReplayClient
+    >>> ce = RecordingClient(boto3.client("ce"), "fixtures/ce.json")
+    >>> CostExplorer(client=ce).add_report(Name="Services", GroupBy=[...])
+    >>> ce.save()
+    """
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.records = {}
+        self.calls = collections.Counter()
+
+    def __getattr__(self, operation):
+        if operation.startswith("_"):
+            raise AttributeError(operation)
+        fn = getattr(self.client, operation)
+
+        def call(**kwargs):
+            self.calls[operation] += 1
+            response = fn(**kwargs)
+            # Request IDs and dates differ per call, only the size is kept
+            metadata = response.pop("ResponseMetadata", {})
+            length = metadata.get("HTTPHeaders", {}).get("content-length")
+            if length:
+                response["ResponseMetadata"] = {
+                    "HTTPHeaders": {"content-length": length}
+                }
+            self.records[_params_key(operation, kwargs)] = response
+            return response
+
+        return call
+
+    def save(self):
+        with open(self.path, "w") as file:
+            json.dump(self.records, file, default=str)
+
+
+class ReplayClient:
+    """Answers calls from a RecordingClient fixture (or its records), a
+    request that was not recorded raises ClientError like an unknown S3 key
+    """
+
+    def __init__(self, path=None, records=None):
+        if records is None:
+            with open(path) as file:
+                records = json.load(file)
+        self.records = records
+        self.calls = collections.Counter()
+
+    def __getattr__(self, operation):
+        if operation.startswith("_"):
+            raise AttributeError(operation)
+
+        def call(**kwargs):
+            self.calls[operation] += 1
+            key = _params_key(operation, kwargs)
+            if key not in self.records:
+                raise ClientError(
+                    {"Error": {"Code": "NotRecorded", "Message": key}}, operation
+                )
+            return self.records[key]
+
+        return call
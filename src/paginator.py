@@ -0,0 +1,45 @@
+"""
+Paginator
+
+Streams pages from the Cost Explorer operations used by the report. Every
+page is requested with the original parameters plus the NextPageToken of the
+previous response, results are yielded as each page arrives.
+"""
+
+RESULT_KEYS = {
+    "get_cost_and_usage": "ResultsByTime",
+    "get_reservation_coverage": "CoveragesByTime",
+    "get_reservation_utilization": "UtilizationsByTime",
+    "get_reservation_purchase_recommendation": "Recommendations",
+    "get_tags": "Tags",
+}
+
+
+def _call(fn, **kwargs):
+    return fn(**kwargs)
+
+
+def paginate(client, operation, params, call=_call):
+    """Yield every response page of client.<operation>(**params)
+
+    call(fn, **kwargs) performs the request, e.g. Throttle.call.
+    """
+    fn = getattr(client, operation)
+    token = None
+    while True:
+        kwargs = dict(params)
+        if token:
+            kwargs["NextPageToken"] = token
+        response = call(fn, **kwargs)
+        yield response
+        token = response.get("NextPageToken")
+        if not token:
+            return
+
+
+def iter_results(client, operation, params, call=_call):
+    """Yield the result items (e.g. ResultsByTime entries) of every page"""
+    result_key = RESULT_KEYS[operation]
+    for response in paginate(client, operation, params, call=call):
+        for result in response.get(result_key, []):
+            yield result
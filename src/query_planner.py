@@ -0,0 +1,139 @@
+"""
+Query Planner
+
+Collects the Cost Explorer queries behind a set of reports, runs each unique
+query once and hands the shared result to every report built from it.
+Independent queries run concurrently on a bounded thread pool.
+
+A query with a single report is streamed into it, from the worker thread
+when the pool is used, and the results of a shared query are dropped once
+its last report is derived, unless keep_results asks for them to be reused
+by later executions.
+"""
+
+import json
+import queue
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Marks the end of a streamed query
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+def _stream(fetch, results):
+    """Put every result of fetch() on the results queue, then _DONE"""
+    try:
+        for result in fetch():
+            results.put(result)
+    except Exception as e:
+        results.put(_Failed(e))
+        raise
+    results.put(_DONE)
+
+
+def _drain(results):
+    """Yield the results a worker puts on the queue as they arrive"""
+    while True:
+        result = results.get()
+        if result is _DONE:
+            return
+        if isinstance(result, _Failed):
+            raise result.error
+        yield result
+
+
+class QueryPlanner:
+    """Groups registered reports by query signature
+    >>> planner = QueryPlanner()
+    >>> planner.register(signature, fetch, derive)
+    >>> planner.execute()
+
+    keep_results=True keeps the results of every query between executions,
+    so a later report on the same query is not fetched again.
+    """
+
+    def __init__(self, max_workers=1, keep_results=False):
+        self.max_workers = max_workers
+        self.keep_results = keep_results
+        # Reports waiting to be executed, in registration order.
+        self.pending = []
+        # Results of queries already run, keyed by signature. Only held
+        # until the last report of the query is derived without keep_results.
+        self.results = {}
+        self.queries_run = 0
+
+    @staticmethod
+    def signature(operation, params):
+        """Stable key for an API operation and its request parameters"""
+        return json.dumps(
+            {"Operation": operation, "Params": params}, sort_keys=True, default=str
+        )
+
+    def register(self, signature, fetch, derive):
+        """Queue a report; fetch() returns an iterable of results and
+        derive(results) builds the report from it.
+        """
+        self.pending.append((signature, fetch, derive))
+
+    def fetch(self, signature, fetch):
+        if signature not in self.results:
+            self.results[signature] = list(fetch())
+            self.queries_run += 1
+        return self.results[signature]
+
+    def execute(self):
+        """Run each unique pending query once, then derive reports in order"""
+        pending, self.pending = self.pending, []
+        consumers = Counter(signature for signature, _, _ in pending)
+        queries = OrderedDict()
+        for signature, fetch, _ in pending:
+            if signature not in self.results:
+                queries.setdefault(signature, fetch)
+        # Materialized when shared or kept, streamed otherwise
+        shared = {
+            signature
+            for signature in queries
+            if self.keep_results or consumers[signature] > 1
+        }
+        if self.max_workers > 1 and len(queries) > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {}
+                streams = {}
+                for signature, fetch in queries.items():
+                    if signature in shared:
+                        futures[signature] = pool.submit(
+                            lambda fetch=fetch: list(fetch())
+                        )
+                    else:
+                        streams[signature] = queue.Queue()
+                        futures[signature] = pool.submit(
+                            _stream, fetch, streams[signature]
+                        )
+                    self.queries_run += 1
+                for signature, fetch, derive in pending:
+                    if signature in streams:
+                        derive(_drain(streams.pop(signature)))
+                    else:
+                        if signature not in self.results:
+                            self.results[signature] = futures[signature].result()
+                        self._derive(signature, derive, consumers)
+        else:
+            for signature, fetch, derive in pending:
+                if signature in shared:
+                    self.fetch(signature, fetch)
+                if signature in self.results:
+                    self._derive(signature, derive, consumers)
+                else:
+                    self.queries_run += 1
+                    derive(fetch())
+
+    def _derive(self, signature, derive, consumers):
+        derive(self.results[signature])
+        consumers[signature] -= 1
+        if not consumers[signature] and not self.keep_results:
+            del self.results[signature]
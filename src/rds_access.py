@@ -1,28 +1,163 @@
+import datetime
 import json
-from typing import List, Mapping, Sequence, Union
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, List, Mapping, Sequence, Union
 
 import boto3
+import numpy as np
 import pandas as pd
 import psycopg2
 from psycopg2.extensions import connection
+from psycopg2.pool import ThreadedConnectionPool
 
+SECRET_ID = os.getenv("DB_SECRET_ID", "prod-db-main")
+# Seconds the database secret is reused before asking Secrets Manager again
+SECRET_TTL = int(os.getenv("DB_SECRET_TTL", "900"))
+POOL_MAX_CONNECTIONS = int(os.getenv("DB_POOL_MAX_CONNECTIONS", "4"))
 
-def get_config():
+# Module level so warm Lambda invocations reuse the secret and connections
+_secret = None
+_secret_loaded_at = 0.0
+_pool = None
+_lock = threading.Lock()
 
-    client = boto3.client("secretsmanager")
-    secrets = client.get_secret_value(SecretId="prod-db-main")
-    secrets_dict = json.loads(secrets["SecretString"])
-    return secrets_dict
 
+def get_config(refresh: bool = False) -> dict:
+    global _secret, _secret_loaded_at
 
-def get_connection() -> connection:
-    secrets_dict = get_config()
-    username = secrets_dict["username"]
-    password = secrets_dict["password"]
-    host = secrets_dict["host"]
-    dbname = secrets_dict["dbname"]
-    conn = psycopg2.connect(dbname=dbname, user=username, password=password, host=host)
-    return conn
+    with _lock:
+        if refresh or _secret is None or time.time() - _secret_loaded_at > SECRET_TTL:
+            client = boto3.client("secretsmanager")
+            secrets = client.get_secret_value(SecretId=SECRET_ID)
+            _secret = json.loads(secrets["SecretString"])
+            _secret_loaded_at = time.time()
+        return _secret
+
+
+class BlockingPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool whose getconn waits for a connection to be put
+    back instead of raising PoolError once maxconn are borrowed
+    >>> pool = BlockingPool(1, 4, dbname="db", user="user", password="...")
+    >>> conn = pool.getconn()
+    >>> pool.putconn(conn)
+    >>> pool.retire()
+
+    A retired pool is closed as soon as every borrowed connection is back.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._borrowed = 0
+        self._retired = False
+        self._state = threading.Lock()
+
+    def getconn(self, key=None) -> connection:
+        self._slots.acquire()
+        try:
+            conn = super().getconn(key)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._state:
+            self._borrowed += 1
+        return conn
+
+    def putconn(self, conn=None, key=None, close=False) -> None:
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            with self._state:
+                self._borrowed -= 1
+                done = self._retired and not self._borrowed
+            self._slots.release()
+        if done:
+            self._close()
+
+    def retire(self) -> None:
+        """Close the pool once connections other threads still use are back"""
+        with self._state:
+            self._retired = True
+            done = not self._borrowed
+        if done:
+            self._close()
+
+    def _close(self) -> None:
+        if not self.closed:
+            self.closeall()
+
+
+def get_pool(refresh: bool = False) -> BlockingPool:
+    """Connection pool, replaced by one with a fresh secret when refresh is set"""
+    global _pool
+
+    secrets_dict = get_config(refresh=refresh)
+    with _lock:
+        if refresh and _pool is not None:
+            _pool.retire()
+            _pool = None
+        if _pool is None:
+            _pool = BlockingPool(
+                1,
+                POOL_MAX_CONNECTIONS,
+                dbname=secrets_dict["dbname"],
+                user=secrets_dict["username"],
+                password=secrets_dict["password"],
+                host=secrets_dict["host"],
+            )
+        return _pool
+
+
+def is_healthy(conn: connection) -> bool:
+    if conn.closed:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@contextmanager
+def get_connection(refresh: bool = False):
+    """Borrow a healthy pooled connection, it is returned to the pool after use
+    >>> with get_connection() as conn:
+    ...     conn.cursor().execute("SELECT 1")
+    """
+    pool = get_pool(refresh=refresh)
+    conn = pool.getconn()
+    if not is_healthy(conn):
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        # Broken connections are dropped rather than handed out again
+        broken = True
+        raise
+    except BaseException:
+        # Includes GeneratorExit when a stream_query consumer stops early
+        conn.rollback()
+        raise
+    finally:
+        # Connections of a pool replaced meanwhile are closed, not kept
+        pool.putconn(conn, close=broken or pool is not _pool)
+
+
+def close_connections() -> None:
+    global _pool
+
+    with _lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
 
 
 def run_query(
@@ -31,43 +166,130 @@ def run_query(
     read_only: bool = True,
 ) -> List:
 
-    real_connection = get_connection()
-    if read_only:
+    for attempt in range(2):
+        try:
+            # On reconnect the secret is reloaded in case it was rotated
+            with get_connection(refresh=attempt > 0) as real_connection:
+                real_connection.set_session(readonly=read_only)
+                cursor = real_connection.cursor()
+                cursor.execute(sql, substitutions)
+                rows = cursor.fetchall()
+                cursor.close()
+                real_connection.commit()
+                return rows
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            if attempt:
+                raise
+
+
+def stream_query(
+    sql: str,
+    substitutions: Union[Sequence, Mapping] = None,
+    itersize: int = 2000,
+) -> Iterator[tuple]:
+    """Yield rows from a named (server-side) cursor, itersize rows per fetch"""
+    with get_connection() as real_connection:
         real_connection.set_session(readonly=True)
-    cursor = real_connection.cursor()
-    cursor.execute(sql, substitutions)
-    rows = cursor.fetchall()
-    cursor.close()
-    real_connection.commit()
-    return rows
+        cursor = real_connection.cursor(name="stream_query_{}".format(uuid.uuid4().hex))
+        cursor.itersize = itersize
+        cursor.execute(sql, substitutions)
+        for row in cursor:
+            yield row
+        cursor.close()
+        real_connection.commit()
+
+
+def get_dogs_per_tranche(tranche_dates: Sequence[datetime.date]) -> dict:
+    """Dogs genotyped per tranche date, every tranche counted in one query.
+
+    Dogs are counted by latest_tranche_date and a re-genotyped dog moves to a
+    later tranche, so counts are not kept between runs.
+    """
+    if not tranche_dates:
+        return {}
+    query = """
+SELECT latest_tranche_date, count(*) AS dogs_in_delivery
+FROM genotypes
+WHERE latest_tranche_date = ANY(%(tranche_dates)s)
+GROUP BY latest_tranche_date
+    """
+    counted = dict(
+        run_query(query, substitutions={"tranche_dates": list(tranche_dates)})
+    )
+    return {
+        tranche_date.isoformat(): counted.get(tranche_date)
+        for tranche_date in tranche_dates
+    }
+
+
+def _delivery_date(delivery_id: str):
+    parts = delivery_id.split("_")
+    return parts[1] if len(parts) > 1 else None
 
 
 def get_dogs_per_day(n_days: int = 14):
+    """Dogs per delivery date of the last n_days deliveries"""
     query = """
-    WITH dogs_per_tranche AS 
-(
-    SELECT latest_tranche_date, count(*) AS dogs_in_delivery FROM genotypes WHERE latest_tranche_date IS NOT NULL GROUP BY latest_tranche_date
-)
 SELECT
     illumina_delivery
-    , extract(epoch FROM pipeline_completed_at - pipeline_started_at)/(60*60) AS pipeline_runtime_hrs
-    , 12 AS target
-    , d.dogs_in_delivery AS num_dogs
-FROM pipeline_status p
-LEFT JOIN dogs_per_tranche d
-ON p.tranche_date = d.latest_tranche_date
+    , tranche_date
+FROM pipeline_status
 WHERE NOW() - delivery_uploaded_to_s3_at < '%(n_days)s days'
 ORDER BY pipeline_started_at asc
     """
 
-    records = run_query(query, substitutions={"n_days": n_days})
-    df = pd.DataFrame.from_records(
-        records, columns=["delivery_id", "runtime", "target", "n_dogs"]
+    dates = []
+    tranches = []
+    for delivery_id, tranche_date in stream_query(
+        query, substitutions={"n_days": n_days}
+    ):
+        dates.append(_delivery_date(delivery_id))
+        tranches.append(tranche_date)
+
+    dogs_per_tranche = get_dogs_per_tranche(
+        sorted({tranche for tranche in tranches if tranche is not None})
+    )
+    n_dogs = np.array(
+        [
+            dogs_per_tranche.get(tranche.isoformat()) if tranche else None
+            for tranche in tranches
+        ],
+        dtype=float,
     )
-    df["date"] = df["delivery_id"].str.split("_", expand=True)[1]
+    df = pd.DataFrame({"n_dogs": n_dogs, "date": dates})
     df = df.sort_values("date", ascending=True)
-    sliced_df = df.iloc[-n_days:, 3:]
-    sliced_df.dropna(inplace=True)
+    sliced_df = df.iloc[-n_days:]
+    sliced_df = sliced_df.dropna()
     dogs_per_day = sliced_df.set_index("date", drop=True)
-    dogs_per_day.loc["total", "n_dogs"] = sum(dogs_per_day["n_dogs"])
     return dogs_per_day
+
+
+def get_deliveries_per_day(n_days: int = 14):
+    """Deliveries and pipeline runtime hours (pipeline_runtime_hrs, started to
+    completed) per delivery date of the deliveries uploaded in the last n_days
+    """
+    query = """
+SELECT
+    illumina_delivery
+    , extract(epoch FROM pipeline_completed_at - pipeline_started_at)/(60*60) AS pipeline_runtime_hrs
+FROM pipeline_status
+WHERE NOW() - delivery_uploaded_to_s3_at < '%(n_days)s days'
+    """
+
+    dates = []
+    hours = []
+    for delivery_id, runtime_hours in stream_query(
+        query, substitutions={"n_days": n_days}
+    ):
+        dates.append(_delivery_date(delivery_id))
+        hours.append(runtime_hours)
+
+    df = pd.DataFrame(
+        {
+            "date": dates,
+            "n_deliveries": 1.0,
+            "runtime_hours": np.array(hours, dtype=float),
+        }
+    )
+    df = df.dropna(subset=["date"])
+    return df.groupby("date").sum().sort_index()
@@ -0,0 +1,401 @@
+"""
+Report Spec
+
+Describes a run as data instead of plan_report calls, in YAML or JSON:
+
+    Settings:
+      TrailingDays: 14
+      IncSupport: false
+    Reports:
+      - Name: Services
+        GroupBy: [{Type: DIMENSION, Key: SERVICE}]
+        Style: Total
+      - {Type: ri, Name: RICoverage}
+      - {Type: per_dog}
+      - {Type: unit_cost, Report: Services, Denominator: deliveries}
+    Output:
+      Formats: [xlsx, parquet]
+
+Report entries take the arguments of the matching CostExplorer.plan_*
+method. A spec is validated as a whole before anything is planned, and
+--dry-run prints the Cost Explorer requests, pages and charges a run would
+cost without calling AWS.
+
+    python report_spec.py reports.yaml --dry-run
+    python report_spec.py reports.yaml
+"""
+
+import argparse
+import inspect
+import json
+import math
+
+from change_styles import STYLES
+from cost_cache import periods, to_date
+from cost_explorer_report import CUBE_REPORT_NAMES, RI_REPORT_NAMES, CostExplorer
+from exporters import EXPORTERS
+from fan_out import PAYER_ACCOUNTS, FanOut
+from tag_cache import TagValueResolver, split_tag_filter
+from unit_cost import DENOMINATORS
+
+# Cost Explorer charges per paginated request, see the README
+CE_REQUEST_PRICE = 0.01
+
+REPORT_TYPES = {
+    "cost": "plan_report",
+    "cube": "plan_cube_reports",
+    "ri": "plan_ri_report",
+    "ri_sweep": "plan_ri_sweep",
+    "per_dog": "plan_per_dog_report",
+    "unit_cost": "plan_unit_cost_report",
+}
+SETTINGS = (
+    "TrailingDays",
+    "CurrentDay",
+    "LastMonthOnly",
+    "IncSupport",
+    "TagKey",
+    "TagValueFilter",
+)
+GRANULARITIES = ("DAILY", "MONTHLY", "HOURLY")
+GROUP_TYPES = ("DIMENSION", "TAG", "COST_CATEGORY")
+# Cost Explorer groups by at most two keys
+MAX_GROUP_BY = 2
+
+
+def load_spec(path):
+    """Read a spec from a .yaml / .yml (needs PyYAML) or .json file"""
+    with open(path) as file:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+
+            return yaml.safe_load(file)
+        return json.load(file)
+
+
+def _arguments(report_type):
+    method = getattr(CostExplorer, REPORT_TYPES[report_type])
+    return [name for name in inspect.signature(method).parameters if name != "self"]
+
+
+def _report_errors(index, report, names):
+    where = "Reports[{}]".format(index)
+    if not isinstance(report, dict):
+        return ["{} must be a mapping".format(where)]
+    report_type = report.get("Type", "cost")
+    if report_type not in REPORT_TYPES:
+        return [
+            "{} has unknown Type {}, expected one of {}".format(
+                where, report_type, list(REPORT_TYPES)
+            )
+        ]
+    errors = []
+    allowed = _arguments(report_type)
+    for key in report:
+        if key != "Type" and key not in allowed:
+            errors.append(
+                "{} ({}) has unknown key {}, expected one of {}".format(
+                    where, report_type, key, allowed
+                )
+            )
+    if report_type == "cost" and "Name" not in report:
+        errors.append("{} needs a Name".format(where))
+    if "Style" in report and report["Style"] not in STYLES:
+        errors.append(
+            "{} has unknown Style {}, expected one of {}".format(
+                where, report["Style"], STYLES
+            )
+        )
+    if "Granularity" in report and report["Granularity"] not in GRANULARITIES:
+        errors.append(
+            "{} has unknown Granularity {}".format(where, report["Granularity"])
+        )
+    group_by = report.get("GroupBy", [])
+    if not isinstance(group_by, list):
+        errors.append("{} GroupBy must be a list".format(where))
+        group_by = []
+    elif len(group_by) > MAX_GROUP_BY:
+        errors.append(
+            "{} GroupBy has {} keys, Cost Explorer allows at most {}".format(
+                where, len(group_by), MAX_GROUP_BY
+            )
+        )
+    if "Metrics" in report and not (
+        isinstance(report["Metrics"], list)
+        and report["Metrics"]
+        and all(isinstance(metric, str) for metric in report["Metrics"])
+    ):
+        errors.append("{} Metrics must be a non empty list of names".format(where))
+    for group in group_by:
+        if not isinstance(group, dict) or group.get("Type") not in GROUP_TYPES:
+            errors.append(
+                "{} GroupBy entries need a Type in {} and a Key".format(
+                    where, GROUP_TYPES
+                )
+            )
+        elif not group.get("Key"):
+            errors.append("{} GroupBy entry {} has no Key".format(where, group))
+    if report_type == "cube":
+        dimensions = report.get("Dimensions", ("SERVICE", "REGION"))
+        if not isinstance(dimensions, (list, tuple)) or not (
+            0 < len(dimensions) <= MAX_GROUP_BY
+        ):
+            errors.append(
+                "{} Dimensions must be a list of 1 to {} keys".format(
+                    where, MAX_GROUP_BY
+                )
+            )
+            dimensions = []
+        produced = list(
+            report.get("Reports")
+            or ["Total"] + [CUBE_REPORT_NAMES.get(d, d) for d in dimensions]
+        )
+    elif report_type == "per_dog":
+        if "Services" not in names:
+            errors.append("{} needs a Services report before it".format(where))
+        produced = ["ServicesPerDog"]
+    elif report_type == "unit_cost":
+        report_name = report.get("Report", "Services")
+        denominator = report.get("Denominator", "dogs")
+        if report_name not in names:
+            errors.append("{} needs a {} report before it".format(where, report_name))
+        if denominator not in DENOMINATORS:
+            errors.append(
+                "{} has unknown Denominator {}, expected one of {}".format(
+                    where, denominator, list(DENOMINATORS)
+                )
+            )
+            produced = [report.get("Name", report_name)]
+        else:
+            produced = [report.get("Name", report_name + DENOMINATORS[denominator][2])]
+    elif report_type == "ri_sweep":
+        produced = [report.get("Name", "RISweep")]
+    elif report_type == "ri":
+        produced = [report.get("Name", "RICoverage")]
+        if produced[0] not in RI_REPORT_NAMES:
+            errors.append(
+                "{} has unknown RI report Name {}, expected one of {}".format(
+                    where, produced[0], list(RI_REPORT_NAMES)
+                )
+            )
+    else:
+        produced = [report.get("Name", "Default")]
+    for name in produced:
+        if name in names:
+            errors.append("{} repeats report name {}".format(where, name))
+        names.append(name)
+    return errors
+
+
+def validate_spec(spec):
+    """Raise ValueError listing every problem with spec"""
+    if not isinstance(spec, dict):
+        raise ValueError("A report spec must be a mapping")
+    errors = []
+    for key in spec:
+        if key not in ("Settings", "Reports", "Output"):
+            errors.append("Unknown top level key {}".format(key))
+    for key in spec.get("Settings") or {}:
+        if key not in SETTINGS:
+            errors.append(
+                "Unknown setting {}, expected one of {}".format(key, list(SETTINGS))
+            )
+    reports = spec.get("Reports")
+    if not reports or not isinstance(reports, list):
+        errors.append("Reports must be a non empty list")
+        reports = []
+    names = []
+    for index, report in enumerate(reports):
+        errors.extend(_report_errors(index, report, names))
+    for export_format in (spec.get("Output") or {}).get("Formats", []):
+        if export_format not in EXPORTERS:
+            errors.append(
+                "Unknown output format {}, expected one of {}".format(
+                    export_format, list(EXPORTERS)
+                )
+            )
+    if errors:
+        raise ValueError("Invalid report spec:\n  " + "\n  ".join(errors))
+
+
+def apply_spec(costexplorer, spec):
+    """Validate spec, apply its Settings and plan its reports"""
+    validate_spec(spec)
+    settings = spec.get("Settings") or {}
+    period = {
+        key: settings[key]
+        for key in ("TrailingDays", "CurrentDay", "LastMonthOnly")
+        if key in settings
+    }
+    if period:
+        costexplorer.set_period(**period)
+    costexplorer.inc_support = settings.get("IncSupport", costexplorer.inc_support)
+    costexplorer.tag_key = settings.get("TagKey", costexplorer.tag_key)
+    costexplorer.tag_value_filter = settings.get(
+        "TagValueFilter", costexplorer.tag_value_filter
+    )
+    if "parquet" in (spec.get("Output") or {}).get("Formats", []):
+        costexplorer.keep_frames = True
+    for report in spec["Reports"]:
+        arguments = dict(report)
+        method = REPORT_TYPES[arguments.pop("Type", "cost")]
+        getattr(costexplorer, method)(**arguments)
+    return costexplorer
+
+
+def run_spec(spec, costexplorer=None):
+    if PAYER_ACCOUNTS:
+        # Same spec for every payer, see fan_out.py
+        validate_spec(spec)
+        costexplorer = FanOut(
+            lambda payer: apply_spec(payer, spec), costexplorer=costexplorer
+        ).run()
+    else:
+        costexplorer = apply_spec(costexplorer or CostExplorer(), spec)
+        costexplorer.run_planned_reports()
+    costexplorer.output((spec.get("Output") or {}).get("Formats"))
+    return costexplorer
+
+
+class DryRunClient:
+    """Stands in for the ce client while planning, the only request made at
+    plan time is get_tags, which is counted and answered with tag_values
+    placeholder values, none by default
+    """
+
+    def __init__(self, tag_values=0):
+        self.requests = 0
+        self.tag_values = tag_values
+
+    def get_tags(self, **kwargs):
+        self.requests += 1
+        return {"Tags": ["dry-run-{}".format(i) for i in range(self.tag_values)]}
+
+    def __getattr__(self, operation):
+        raise RuntimeError("{} called during a dry run".format(operation))
+
+
+def estimate(spec, groups=20, rows_per_page=5000, tag_values=None):
+    """Requests, pages and charges of the queries a spec resolves to.
+
+    Cost Explorer pages are not sized by a documented count, so pages of a
+    grouped query are estimated as periods x groups (per GroupBy key) over
+    rows_per_page. Queries shared by reports are counted once, like the
+    planner runs them. Periods already in the cost cache or the report
+    history are not subtracted, so with COST_CACHE or REPORT_HISTORY on this
+    is an upper bound.
+
+    Reports filtered on a TagKey are fetched in one batch per
+    TAG_FILTER_BATCH_SIZE tag values, tag_values is the expected value count.
+    Without it tag batches are not estimated (TagBatchesEstimated is False)
+    and each such query counts as a single batch.
+    """
+    client = DryRunClient(tag_values=tag_values or 0)
+    costexplorer = CostExplorer(client=client, cost_cache=False, history=False)
+    # The dry run client has no tags to offer, they must not reach the cache
+    costexplorer.tags = TagValueResolver(
+        costexplorer.tags.fetch, path=None, bucket=None
+    )
+    apply_spec(costexplorer, spec)
+    queries = []
+    seen = set()
+    for signature, _, _ in costexplorer.planner.pending:
+        if signature in seen:
+            continue
+        seen.add(signature)
+        if signature.startswith("rds:"):
+            queries.append({"Operation": signature, "Periods": 0, "Pages": 0})
+            continue
+        if signature.startswith("ri:"):
+            # RI coverage / utilization, one request over every RI window
+            operation, granularity = signature.split(":")[1:3]
+            window = costexplorer.ri_data.params(operation, granularity)
+            start = to_date(window["TimePeriod"]["Start"])
+            end = to_date(window["TimePeriod"]["End"])
+            queries.append(
+                {
+                    "Operation": operation,
+                    "Periods": len(periods(start, end, granularity)),
+                    "Pages": 1,
+                }
+            )
+            continue
+        query = json.loads(signature)
+        params = query["Params"]
+        pages = 1
+        n_periods = 0
+        if query["Operation"] == "get_cost_and_usage":
+            start = to_date(params["TimePeriod"]["Start"])
+            end = to_date(params["TimePeriod"]["End"])
+            n_periods = len(periods(start, end, params["Granularity"]))
+            rows = n_periods * groups ** len(params.get("GroupBy") or [])
+            # Each batch of tag values is a request of its own
+            pages = len(split_tag_filter(params)) * max(
+                1, math.ceil(rows / rows_per_page)
+            )
+        keys = [group["Key"] for group in params.get("GroupBy") or []]
+        queries.append(
+            {
+                "Operation": " ".join([query["Operation"]] + keys),
+                "Periods": n_periods,
+                "Pages": pages,
+            }
+        )
+    requests = client.requests + sum(query["Pages"] for query in queries)
+    return {
+        "Queries": queries,
+        "TagBatchesEstimated": tag_values is not None or not costexplorer.tag_key,
+        "PlanRequests": client.requests,
+        "Requests": requests,
+        "Dollars": requests * CE_REQUEST_PRICE,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a report spec")
+    parser.add_argument("spec", help="YAML or JSON report spec")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="print the Cost Explorer requests and charges without calling AWS",
+    )
+    parser.add_argument(
+        "--groups", type=int, default=20, help="expected groups per GroupBy key"
+    )
+    parser.add_argument(
+        "--rows-per-page", type=int, default=5000, help="expected rows per CE page"
+    )
+    parser.add_argument(
+        "--tag-values",
+        type=int,
+        help="expected values of the TagKey, to estimate the tag filter batches",
+    )
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec)
+    if not args.dry_run:
+        run_spec(spec)
+        return
+    result = estimate(
+        spec,
+        groups=args.groups,
+        rows_per_page=args.rows_per_page,
+        tag_values=args.tag_values,
+    )
+    print("{:<48} {:>8} {:>6}".format("query", "periods", "pages"))
+    for query in result["Queries"]:
+        print(
+            "{:<48} {:>8} {:>6}".format(
+                query["Operation"], query["Periods"], query["Pages"]
+            )
+        )
+    print(
+        "{} requests ({} while planning), about ${:.2f} of Cost Explorer "
+        "charges".format(result["Requests"], result["PlanRequests"], result["Dollars"])
+    )
+    if not result["TagBatchesEstimated"]:
+        print("Tag filter batches are not estimated, pass --tag-values to do so")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+RI Data
+
+Reservation coverage and utilization, fetched once per endpoint and
+granularity over the union of the windows the planned RI reports ask for.
+Every Total field of the results is kept in one frame per endpoint, nested
+fields flattened (e.g. CoverageHours.CoverageHoursPercentage), and each RI
+report is a slice of it: the rows of its window and one column. RIUtilization
+and RIUtilizationSavings read different fields of the same rows.
+"""
+
+import pandas as pd
+
+
+def flatten(total, prefix=""):
+    """{"CoverageHours": {"CoverageHoursPercentage": "80"}} ->
+    {"CoverageHours.CoverageHoursPercentage": "80"}
+    """
+    fields = {}
+    for name, value in total.items():
+        if isinstance(value, dict):
+            fields.update(flatten(value, prefix + name + "."))
+        else:
+            fields[prefix + name] = value
+    return fields
+
+
+def ri_frame(results):
+    """Periods x Total fields, numeric where the field is a number"""
+    rows = []
+    for v in results:
+        row = {"date": v["TimePeriod"]["Start"]}
+        row.update(flatten(v.get("Total", {})))
+        rows.append(row)
+    if not rows:
+        return pd.DataFrame(index=pd.Index([], name="date"))
+    df = pd.DataFrame(rows).set_index("date")
+    return df.apply(pd.to_numeric, errors="coerce")
+
+
+class RIData:
+    """Union windows of the planned RI reports and the frames fetched for them
+    >>> signature = ri_data.request(operation, "DAILY", start, end)
+    >>> params = ri_data.params(operation, "DAILY")  # at fetch time
+    >>> df = ri_data.frame(signature, results)
+    """
+
+    def __init__(self):
+        # (operation, granularity) -> [start, end, generation]
+        self.windows = {}
+        # Windows already requested from Cost Explorer, and their frames
+        self.fetched = {}
+        self.frames = {}
+
+    def request(self, operation, granularity, start, end):
+        """Add a report window, returns the planner signature of the fetch"""
+        key = (operation, granularity)
+        window = self.windows.get(key)
+        fetched = self.fetched.get(key)
+        if window is None:
+            window = self.windows[key] = [start, end, 0]
+        elif fetched and not (fetched[0] <= start and end <= fetched[1]):
+            # Wider than what was fetched, a new query for the new window
+            window[:] = [start, end, window[2] + 1]
+            del self.fetched[key]
+        elif not fetched:
+            window[0] = min(window[0], start)
+            window[1] = max(window[1], end)
+        return "ri:{}:{}:{}".format(operation, granularity, window[2])
+
+    def params(self, operation, granularity):
+        start, end, _ = self.windows[(operation, granularity)]
+        self.fetched[(operation, granularity)] = (start, end)
+        return {
+            "TimePeriod": {"Start": start.isoformat(), "End": end.isoformat()},
+            "Granularity": granularity,
+        }
+
+    def frame(self, signature, results):
+        """Frame of a fetch, built once for every report sharing it"""
+        if signature not in self.frames:
+            self.frames[signature] = ri_frame(results)
+        return self.frames[signature]
+
+
+def ri_slice(df, field, label, start, end):
+    """One field over [start, end) as a 1 x periods report frame, an empty
+    frame when there are no periods
+    """
+    dates = df.index
+    rows = df[(dates >= start.isoformat()) & (dates < end.isoformat())]
+    if rows.empty:
+        return pd.DataFrame()
+    result = rows[[field]].astype(float).rename(columns={field: label})
+    return result.fillna(0.0).T
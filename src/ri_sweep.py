@@ -0,0 +1,179 @@
+"""
+RI Sweep
+
+Reservation purchase recommendations over every service, payment option and
+term, as one table. The recommendations of each combination are fetched by
+the query planner like any other report query, so they run concurrently
+under the Cost Explorer rate limit, and are merged into one row per
+recommended reservation, ranked by estimated monthly savings.
+
+Cost Explorer refreshes recommendations once a day, RecommendationCache keeps
+the responses of a day in a small JSON file (optionally in S3) so reruns and
+other reports on the same day do not request them again.
+"""
+
+import datetime
+import json
+import os
+import threading
+
+import pandas as pd
+
+from json_store import JsonStore
+
+RI_SERVICES = (
+    "Amazon Elastic Compute Cloud - Compute",
+    "Amazon Relational Database Service",
+    "Amazon ElastiCache",
+    "Amazon Redshift",
+    "Amazon OpenSearch Service",
+)
+PAYMENT_OPTIONS = ("NO_UPFRONT", "PARTIAL_UPFRONT", "ALL_UPFRONT")
+TERMS = ("ONE_YEAR", "THREE_YEARS")
+
+RECOMMENDATION_CACHE = os.getenv("RECOMMENDATION_CACHE", "false")
+if RECOMMENDATION_CACHE == "true":
+    RECOMMENDATION_CACHE = True
+else:
+    RECOMMENDATION_CACHE = False
+RECOMMENDATION_CACHE_PATH = os.getenv(
+    "RECOMMENDATION_CACHE_PATH", "/tmp/recommendations.json"
+)
+RECOMMENDATION_CACHE_BUCKET = os.getenv("RECOMMENDATION_CACHE_BUCKET")
+RECOMMENDATION_CACHE_KEY = os.getenv(
+    "RECOMMENDATION_CACHE_KEY", "cache/recommendations.json"
+)
+
+# Normalized columns, InstanceDetails differ per service
+DETAIL_COLUMNS = {
+    "Region": ("Region",),
+    "Family": ("Family", "InstanceClass"),
+    "InstanceType": ("InstanceType", "NodeType", "InstanceSize"),
+    "Platform": ("Platform", "DatabaseEngine", "ProductDescription"),
+}
+AMOUNT_COLUMNS = {
+    "Recommended": "RecommendedNumberOfInstancesToPurchase",
+    "Minimum": "MinimumNumberOfInstancesUsedPerHour",
+    "Maximum": "MaximumNumberOfInstancesUsedPerHour",
+    "Savings": "EstimatedMonthlySavingsAmount",
+    "SavingsPercentage": "EstimatedMonthlySavingsPercentage",
+    "OnDemand": "EstimatedMonthlyOnDemandCost",
+    "BreakEvenIn": "EstimatedBreakEvenInMonths",
+    "UpfrontCost": "UpfrontCost",
+    "MonthlyCost": "RecurringStandardMonthlyCost",
+}
+
+
+def sweep_params(
+    Services=RI_SERVICES,
+    PaymentOptions=PAYMENT_OPTIONS,
+    Terms=TERMS,
+    LookbackPeriodInDays="SIXTY_DAYS",
+):
+    """get_reservation_purchase_recommendation params for every combination"""
+    return [
+        {
+            "LookbackPeriodInDays": LookbackPeriodInDays,
+            "TermInYears": term,
+            "PaymentOption": payment_option,
+            "Service": service,
+        }
+        for service in Services
+        for term in Terms
+        for payment_option in PaymentOptions
+    ]
+
+
+def recommendation_rows(params, results):
+    """One normalized row per recommended reservation of a response"""
+    rows = []
+    for result in results:
+        for v in result.get("RecommendationDetails", []):
+            # e.g. {"RDSInstanceDetails": {...}}, one entry per service
+            details = next(iter(v["InstanceDetails"].values()), {})
+            row = {
+                "Service": params["Service"],
+                "Term": params["TermInYears"],
+                "PaymentOption": params["PaymentOption"],
+                "AccountId": v.get("AccountId", ""),
+            }
+            for column, fields in DETAIL_COLUMNS.items():
+                row[column] = next(
+                    (details[field] for field in fields if field in details), ""
+                )
+            for column, field in AMOUNT_COLUMNS.items():
+                row[column] = float(v.get(field) or 0.0)
+            # Every detail (tenancy, deployment, edition...) tells reservations
+            # apart, not only the normalized ones
+            row["Details"] = json.dumps(details, sort_keys=True)
+            rows.append(row)
+    return rows
+
+
+def recommendation_table(rows, BestOnly=False):
+    """Rows without duplicates, ranked by savings from 1.
+    BestOnly keeps the term and payment option with the largest savings for
+    each reservation.
+    """
+    df = pd.DataFrame(
+        rows,
+        columns=["Service", "Term", "PaymentOption", "AccountId"]
+        + list(DETAIL_COLUMNS)
+        + list(AMOUNT_COLUMNS)
+        + ["Details"],
+    )
+    df = df.sort_values("Savings", ascending=False, kind="mergesort")
+    key = ["Service", "AccountId", "Details"]
+    if not BestOnly:
+        key += ["Term", "PaymentOption"]
+    df = df.drop_duplicates(key).drop(columns="Details")
+    df.index = pd.RangeIndex(1, len(df) + 1, name="Rank")
+    return df
+
+
+class RecommendationCache:
+    """Recommendation responses of the current day, keyed by request
+    >>> cache = RecommendationCache()
+    >>> results = cache.get(params, fetch)
+    >>> cache.save()
+    """
+
+    def __init__(
+        self,
+        path=RECOMMENDATION_CACHE_PATH,
+        bucket=RECOMMENDATION_CACHE_BUCKET,
+        key=RECOMMENDATION_CACHE_KEY,
+    ):
+        self.store = JsonStore(path, bucket, key, name="recommendation cache")
+        self.cache = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def _today(self):
+        if self.cache is None:
+            self.cache = self.store.read() or {}
+        today = datetime.date.today().isoformat()
+        # Earlier days are dropped on load, recommendations are daily
+        if self.cache.get("date") != today:
+            self.cache = {"date": today, "results": {}}
+        return self.cache["results"]
+
+    def get(self, params, fetch):
+        query = json.dumps(params, sort_keys=True)
+        with self.lock:
+            results = self._today()
+            if query in results:
+                return results[query]
+        fetched = list(fetch(params))
+        with self.lock:
+            self._today()[query] = fetched
+            self.dirty = True
+        return fetched
+
+    def save(self):
+        if not self.dirty:
+            return
+        with self.lock:
+            cache = self.cache
+            self.dirty = False
+        self.store.write(cache)
@@ -0,0 +1,141 @@
+"""
+Tag Cache
+
+Resolves the values of TAG_KEY once per run, following every get_tags page,
+and keeps them in a small JSON file (optionally in S3) for TAG_CACHE_TTL
+seconds so following runs over the same window skip the lookup.
+
+Reports filtered on more values than fit one filter are split into batches
+of TAG_FILTER_BATCH_SIZE values, one request each, and their results are
+summed back into a single result per period. A resource carries one value
+per tag key, so the batches do not overlap.
+"""
+
+import copy
+import os
+import threading
+import time
+
+from json_store import JsonStore
+
+TAG_CACHE_PATH = os.getenv("TAG_CACHE_PATH", "/tmp/tag_values.json")
+TAG_CACHE_BUCKET = os.getenv("TAG_CACHE_BUCKET")
+TAG_CACHE_KEY = os.getenv("TAG_CACHE_KEY", "cache/tag_values.json")
+TAG_CACHE_TTL = int(os.getenv("TAG_CACHE_TTL", str(24 * 60 * 60)))
+# Cost Explorer rejects filters with very long value lists
+TAG_FILTER_BATCH_SIZE = int(os.getenv("TAG_FILTER_BATCH_SIZE", "500"))
+
+
+class TagValueResolver:
+    """Values of a tag key, fetched at most once per run and TTL
+    >>> tags = TagValueResolver(lambda params: iter_results(ce, "get_tags", params))
+    >>> tags.values("team", "*", start, end)
+
+    path=None and bucket=None keep the values in memory only.
+    """
+
+    def __init__(
+        self,
+        fetch,
+        path=TAG_CACHE_PATH,
+        bucket=TAG_CACHE_BUCKET,
+        key=TAG_CACHE_KEY,
+        ttl=TAG_CACHE_TTL,
+    ):
+        self.fetch = fetch
+        self.store = JsonStore(path, bucket, key, name="tag cache")
+        self.ttl = ttl
+        self.cache = None
+        self.lock = threading.Lock()
+
+    def values(self, tag_key, search_string, start, end):
+        """Every value of tag_key matching search_string in [start, end)"""
+        # Values depend on the window, e.g. LAST_MONTH_ONLY runs see fewer
+        name = "{}|{}|{}|{}".format(
+            tag_key, search_string, start.isoformat(), end.isoformat()
+        )
+        with self.lock:
+            if self.cache is None:
+                self.cache = self.store.read() or {}
+            entry = self.cache.get(name)
+            if entry and time.time() - entry["updated"] <= self.ttl:
+                return entry["values"]
+            values = list(
+                self.fetch(
+                    {
+                        "SearchString": search_string,
+                        "TimePeriod": {
+                            "Start": start.isoformat(),
+                            "End": end.isoformat(),
+                        },
+                        "TagKey": tag_key,
+                    }
+                )
+            )
+            now = time.time()
+            # Expired entries (e.g. of earlier windows) are dropped on write
+            self.cache = {
+                other: entry
+                for other, entry in self.cache.items()
+                if now - entry["updated"] <= self.ttl
+            }
+            self.cache[name] = {"updated": now, "values": values}
+            self.store.write(self.cache)
+            return values
+
+
+def split_tag_filter(params, batch_size=TAG_FILTER_BATCH_SIZE):
+    """get_cost_and_usage params, one per batch of tag values"""
+    expressions = params.get("Filter", {}).get("And", [])
+    for index, expression in enumerate(expressions):
+        if "Tags" in expression:
+            break
+    else:
+        return [params]
+    values = expressions[index]["Tags"]["Values"]
+    if len(values) <= batch_size:
+        return [params]
+    batches = []
+    for start in range(0, len(values), batch_size):
+        batch = copy.deepcopy(params)
+        batch["Filter"]["And"][index]["Tags"]["Values"] = values[
+            start : start + batch_size
+        ]
+        batches.append(batch)
+    return batches
+
+
+def _add_metrics(total, metrics):
+    for metric, value in metrics.items():
+        if metric in total:
+            amount = float(total[metric]["Amount"]) + float(value["Amount"])
+            total[metric] = dict(total[metric], Amount=str(amount))
+        else:
+            total[metric] = dict(value)
+
+
+def merge_results(batches):
+    """Sum ResultsByTime lists of the same query over disjoint filters"""
+    merged = {}
+    for results in batches:
+        for result in results:
+            start = result["TimePeriod"]["Start"]
+            if start not in merged:
+                merged[start] = {
+                    "TimePeriod": result["TimePeriod"],
+                    "Total": {},
+                    "Groups": {},
+                    "Estimated": False,
+                }
+            period = merged[start]
+            period["Estimated"] = period["Estimated"] or result.get("Estimated", False)
+            _add_metrics(period["Total"], result.get("Total", {}))
+            for group in result.get("Groups", []):
+                keys = tuple(group["Keys"])
+                if keys not in period["Groups"]:
+                    period["Groups"][keys] = {"Keys": group["Keys"], "Metrics": {}}
+                _add_metrics(period["Groups"][keys]["Metrics"], group["Metrics"])
+    for start in sorted(merged):
+        period = merged[start]
+        period["Groups"] = list(period["Groups"].values())
+        yield period
@@ -0,0 +1,96 @@
+"""
+Throttle
+
+A token bucket shared by every thread that calls Cost Explorer, with retries
+on throttling errors using exponential backoff and full jitter.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+# Cost Explorer allows a handful of requests per second per account
+CE_REQUESTS_PER_SECOND = float(os.getenv("CE_REQUESTS_PER_SECOND", "5"))
+CE_MAX_RETRIES = int(os.getenv("CE_MAX_RETRIES", "8"))
+
+THROTTLING_ERRORS = (
+    "ThrottlingException",
+    "Throttling",
+    "LimitExceededException",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+)
+
+
+class Throttle:
+    """Rate limits calls and retries them when AWS throttles
+    >>> throttle = Throttle(rate=5)
+    >>> response = throttle.call(client.get_cost_and_usage, **params)
+    """
+
+    def __init__(
+        self,
+        rate=CE_REQUESTS_PER_SECOND,
+        burst=None,
+        max_retries=CE_MAX_RETRIES,
+        base_delay=0.5,
+        max_delay=20.0,
+    ):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self.tokens = self.burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request token is available"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttled(self):
+        # Back off the shared rate so every worker slows down, not just this one
+        with self.lock:
+            self.rate = max(self.max_rate / 8, self.rate / 2)
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+    def call(self, fn, **kwargs):
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                response = fn(**kwargs)
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code not in THROTTLING_ERRORS or attempt >= self.max_retries:
+                    raise
+                self.throttled()
+                delay = random.uniform(
+                    0, min(self.max_delay, self.base_delay * 2**attempt)
+                )
+                logging.warning("%s throttled, retrying in %.2fs", code, delay)
+                time.sleep(delay)
+                attempt += 1
+            else:
+                self.succeeded()
+                return response
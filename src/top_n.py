@@ -0,0 +1,62 @@
+"""
+Top N
+
+Keeps the N groups with the largest total of a report and folds every other
+group into one "Other" row, so the chart stays readable and the report still
+adds up to the full spend. The N groups are found with a partial selection
+(np.argpartition) and only those N are sorted.
+
+Reports with more than TOP_N_MAX_GROUPS groups are already folded while they
+are built, see CostFrameBuilder, so the full group set is never held. Those
+folds go by the running spend, a group that only grows large late in the
+window can end up in OTHER; totals are exact either way.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+OTHER = "Other"
+TOP_N = int(os.getenv("TOP_N", "10"))
+TOP_N_OTHER = os.getenv("TOP_N_OTHER", "true")
+if TOP_N_OTHER == "true":
+    TOP_N_OTHER = True
+else:
+    TOP_N_OTHER = False
+# Groups held per report while results stream in, beyond that the smallest
+# are folded into OTHER as they arrive (e.g. USAGE_TYPE or RESOURCE_ID)
+TOP_N_MAX_GROUPS = int(os.getenv("TOP_N_MAX_GROUPS", "5000"))
+
+
+def top_n(df, n=TOP_N, other=TOP_N_OTHER):
+    """Groups x periods frame cut to the n largest groups by total, with a
+    total column, largest first and ties broken by the last period.
+
+    An existing OTHER group (see CostFrameBuilder max_groups) is always
+    folded into the OTHER row. n=None keeps every group.
+    """
+    values = df.to_numpy(dtype=float)
+    totals = df.sum(axis=1).to_numpy(dtype=float)  # same sums as before
+    folded = np.asarray(df.index == OTHER)
+    candidates = np.flatnonzero(~folded)
+    if n is not None and len(candidates) > n:
+        picked = np.argpartition(-totals[candidates], n - 1)[:n] if n else []
+        keep = candidates[picked]
+    else:
+        keep = candidates
+    last = values[keep, -1] if values.shape[1] else np.zeros(len(keep))
+    keep = keep[np.lexsort((-last, -totals[keep]))]
+
+    result = df.iloc[keep].copy()
+    result["total"] = totals[keep]
+    rest = np.ones(len(df), dtype=bool)
+    rest[keep] = False
+    if other and rest.any():
+        row = pd.DataFrame(
+            [np.append(values[rest].sum(axis=0), totals[rest].sum())],
+            index=pd.Index([OTHER], name=result.index.name),
+            columns=result.columns,
+        )
+        result = pd.concat([result, row])
+    return result
@@ -0,0 +1,53 @@
+"""
+Unit Cost
+
+Divides cost reports by a daily volume from the database, e.g. cost per dog
+genotyped, per pipeline runtime hour or per delivery. The volume is aligned
+on the report's dates and every group is divided at once, days without any
+volume (missing or zero) are left out of the daily columns but their cost
+still counts in the total, which is the total cost over the total volume.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Denominator -> rds_access function, its column and the report name suffix
+DENOMINATORS = {
+    "dogs": ("get_dogs_per_day", "n_dogs", "PerDog"),
+    "runtime_hours": ("get_deliveries_per_day", "runtime_hours", "PerRuntimeHour"),
+    "deliveries": ("get_deliveries_per_day", "n_deliveries", "PerDelivery"),
+}
+
+
+def daily_units(df, column):
+    """Volume per date of a rds_access frame, rows of the same date summed"""
+    return df[column].astype(float).groupby(level=0).sum()
+
+
+def unit_cost(df, units, label):
+    """Cost report df (groups x dates + total) per unit of units (per date).
+    The first row of the result is the volume, named label.
+    """
+    dates = [column for column in df.columns if column != "total"]
+    volume = units.reindex(dates).to_numpy(dtype=float)
+    counted = np.nan_to_num(volume) > 0
+    values = df[dates].to_numpy(dtype=float)
+    total_volume = np.nansum(volume)
+    if "total" in df.columns:
+        total = df["total"].to_numpy(dtype=float)
+    else:
+        total = values.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = np.column_stack(
+            [values[:, counted] / volume[counted], total / total_volume]
+        )
+    result[~np.isfinite(result)] = np.nan
+    result = np.vstack([np.append(volume[counted], total_volume), result])
+    return pd.DataFrame(
+        result,
+        index=pd.Index([label] + list(df.index), name=df.index.name),
+        columns=pd.Index(
+            [date for date, kept in zip(dates, counted) if kept] + ["total"],
+            name=df.columns.name,
+        ),
+    )
@@ -0,0 +1,30 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "../src"))
+
+
+def result(start, groups, metrics=("UnblendedCost",)):
+    """A daily get_cost_and_usage ResultsByTime entry
+
+    groups is a list of (keys, amount), keys a single group key or a tuple of
+    them for two GroupBy keys. Each further metric gets amount times its
+    position, so metrics can be told apart.
+    """
+    end = datetime.date.fromisoformat(start) + datetime.timedelta(days=1)
+    return {
+        "TimePeriod": {"Start": start, "End": end.isoformat()},
+        "Total": {},
+        "Groups": [
+            {
+                "Keys": [keys] if isinstance(keys, str) else list(keys),
+                "Metrics": {
+                    metric: {"Amount": str(amount * (i + 1)), "Unit": "USD"}
+                    for i, metric in enumerate(metrics)
+                },
+            }
+            for keys, amount in groups
+        ],
+        "Estimated": False,
+    }
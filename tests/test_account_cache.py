@@ -0,0 +1,36 @@
+import json
+
+from account_cache import AccountDirectory
+
+
+class Organizations:
+    class exceptions:
+        class AWSOrganizationsNotInUseException(Exception):
+            pass
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self):
+        yield {"Accounts": [{"Id": "111111111111", "Name": "prod"}]}
+
+
+def test_labels_are_written_once(tmp_path, monkeypatch):
+    path = tmp_path / "account_labels.json"
+    accounts = AccountDirectory(label="Name", path=str(path), client=Organizations())
+    writes = []
+    write = accounts.store.write
+    monkeypatch.setattr(
+        accounts.store, "write", lambda cache: writes.append(write(cache))
+    )
+
+    labels = [accounts.label(str(n) * 12) for n in range(1, 6)]
+    assert labels[0] == "prod" and labels[1] == "222222222222"
+    assert writes == []
+    accounts.save()
+    accounts.save()
+
+    assert len(writes) == 1
+    cache = json.loads(path.read_text())
+    assert cache["accounts"] == {"111111111111": "prod"}
+    assert len(cache["unknown"]) == 4
@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+from change_styles import apply_style
+
+
+def frame(a, b):
+    dates = ["2026-10-01", "2026-10-02", "2026-10-03"]
+    return pd.DataFrame({"a": a, "b": b}, index=pd.Index(dates, name="date"))
+
+
+def test_change_keeps_the_first_period():
+    df = apply_style(frame([1.0, 3.0, 2.0], [0.0, 0.0, 5.0]), "Change")
+    assert df["a"].tolist() == [1.0, 2.0, -1.0]
+    assert df["b"].tolist() == [0.0, 0.0, 5.0]
+    assert df.index.name == "date"
+
+
+def test_percent_change():
+    df = apply_style(frame([2.0, 3.0, 1.5], [4.0, 2.0, 2.0]), "PercentChange")
+    assert df["a"].tolist() == [0.0, 50.0, -50.0]
+    assert df["b"].tolist() == [0.0, -50.0, 0.0]
+
+
+def test_percent_change_from_zero_is_zero():
+    # x / 0 and 0 / 0 are not infinite or NaN in the report
+    df = apply_style(frame([0.0, 5.0, 0.0], [0.0, 0.0, 1.0]), "PercentChange")
+    assert df["a"].tolist() == [0.0, 0.0, -100.0]
+    assert df["b"].tolist() == [0.0, 0.0, 0.0]
+
+
+def test_unknown_style():
+    with pytest.raises(ValueError):
+        apply_style(frame([1.0] * 3, [1.0] * 3), "Delta")
@@ -0,0 +1,30 @@
+from conftest import result
+from cost_cache import CostCache
+
+
+def test_period_split_across_pages_is_cached_whole(tmp_path):
+    params = {
+        "TimePeriod": {"Start": "2024-01-01", "End": "2024-01-03"},
+        "Granularity": "DAILY",
+        "Metrics": ["UnblendedCost"],
+        "GroupBy": [{"Type": "DIMENSION", "Key": "SERVICE"}],
+    }
+    pages = [
+        result("2024-01-01", [("a", 1.0), ("b", 2.0)]),
+        result("2024-01-01", [("c", 3.0)]),
+        result("2024-01-02", [("a", 4.0)]),
+    ]
+    calls = []
+
+    def fetch(p):
+        calls.append(p)
+        return iter(pages)
+
+    path = str(tmp_path / "cost_cache.sqlite")
+    cold = CostCache(path=path, bucket=None).get(params, fetch)
+    warm = CostCache(path=path, bucket=None).get(params, fetch)
+
+    assert len(calls) == 1
+    assert warm == cold
+    assert [r["TimePeriod"]["Start"] for r in warm] == ["2024-01-01", "2024-01-02"]
+    assert [g["Keys"][0] for g in warm[0]["Groups"]] == ["a", "b", "c"]
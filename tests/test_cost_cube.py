@@ -0,0 +1,16 @@
+from conftest import result
+from cost_cube import build_cube, rollup
+
+
+def test_period_split_across_pages():
+    results = [
+        result("2026-10-01", [(("ec2", "us-east-1"), 1.0), (("s3", "us-east-1"), 2.0)]),
+        result("2026-10-01", [(("ec2", "eu-west-1"), 4.0)]),
+        result("2026-10-02", [(("ec2", "us-east-1"), 8.0)]),
+    ]
+    cube = build_cube(results, ("SERVICE", "REGION"))
+
+    assert rollup(cube)["Total"].tolist() == [7.0, 8.0]
+    services = rollup(cube, "SERVICE")
+    assert list(services.index) == ["2026-10-01", "2026-10-02"]
+    assert services.loc["2026-10-01"].to_dict() == {"ec2": 5.0, "s3": 2.0}
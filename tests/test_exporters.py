@@ -0,0 +1,76 @@
+import datetime
+
+import pandas as pd
+
+from change_styles import apply_style
+from exporters import ParquetExporter
+from top_n import top_n
+
+
+def report(values):
+    """Chart report of one group over consecutive days from 2026-10-01"""
+    dates = [
+        (datetime.date(2026, 10, 1) + datetime.timedelta(days=i)).isoformat()
+        for i in range(len(values))
+    ]
+    df = pd.DataFrame(
+        [values + [sum(values)]], index=["ec2"], columns=dates + ["total"]
+    )
+    return {"Name": "Services", "Data": df, "Type": "chart"}
+
+
+def test_reruns_overwrite_their_periods(tmp_path):
+    exporter = ParquetExporter()
+    exporter.export(
+        [report([1.0, 2.0])], str(tmp_path), "r", datetime.date(2026, 10, 3)
+    )
+    exporter.export(
+        [report([1.0, 3.0, 4.0])], str(tmp_path), "r", datetime.date(2026, 10, 4)
+    )
+
+    history = pd.read_parquet(tmp_path / "parquet")
+    history = history.sort_values("period")
+    assert history["period"].astype(str).tolist() == [
+        "2026-10-01",
+        "2026-10-02",
+        "2026-10-03",
+    ]
+    assert history["value"].tolist() == [1.0, 3.0, 4.0]
+
+
+def change_report(values, start):
+    """Style=Change report built like CostExplorer._add_cost_report"""
+    dates = [
+        (start + datetime.timedelta(days=i)).isoformat() for i in range(len(values))
+    ]
+    frame = pd.DataFrame({"ec2": values}, index=pd.Index(dates, name="date"))
+    return {
+        "Name": "ServicesChange",
+        "Type": "chart",
+        "Style": "Change",
+        "TopN": 10,
+        "Frame": frame,
+        "Data": top_n(apply_style(frame, "Change").T, 10),
+    }
+
+
+def test_change_reports_export_costs_over_overlapping_windows(tmp_path):
+    exporter = ParquetExporter()
+    first = change_report([1.0, 2.0, 4.0], datetime.date(2026, 10, 1))
+    second = change_report([2.0, 4.0, 7.0], datetime.date(2026, 10, 2))
+    exporter.export([first], str(tmp_path), "r", datetime.date(2026, 10, 4))
+    exporter.export([second], str(tmp_path), "r", datetime.date(2026, 10, 5))
+
+    history = pd.read_parquet(tmp_path / "parquet").sort_values("period")
+    # Costs, not the differences of whichever run wrote the period last
+    assert history["value"].tolist() == [1.0, 2.0, 4.0, 7.0]
+    assert set(history["group"]) == {"ec2"}
+
+
+def test_styled_reports_without_a_frame_are_not_exported(tmp_path):
+    styled = dict(change_report([1.0, 2.0], datetime.date(2026, 10, 1)))
+    del styled["Frame"]
+    paths = ParquetExporter().export(
+        [styled], str(tmp_path), "r", datetime.date(2026, 10, 3)
+    )
+    assert paths == []
@@ -0,0 +1,103 @@
+import io
+
+import pandas as pd
+import pytest
+
+import fan_out
+from cost_explorer_report import CostExplorer
+from fan_out import FanOut, parse_accounts
+from local_aws import LocalSTS, local_clients
+from tag_cache import merge_results
+
+ACCOUNTS = {"111111111111": "prod", "222222222222": "labs"}
+STYLES = ("Total", "Change", "PercentChange")
+
+
+class CombinedCostExplorer:
+    """Cost Explorer of the payers' combined spend, each period summed"""
+
+    def __init__(self, clients):
+        self.clients = clients
+
+    def get_cost_and_usage(self, **kwargs):
+        pages = [c.get_cost_and_usage(**kwargs)["ResultsByTime"] for c in self.clients]
+        return {"ResultsByTime": list(merge_results(pages))}
+
+
+def plan(costexplorer):
+    for style in STYLES:
+        costexplorer.plan_report(
+            Name="Services" + style,
+            GroupBy=[{"Type": "DIMENSION", "Key": "SERVICE"}],
+            Style=style,
+            TopN=3,
+        )
+    costexplorer.plan_report(Name="Total", GroupBy=[])
+
+
+def clients(credentials):
+    return local_clients(credentials, groups=12)
+
+
+@pytest.fixture
+def caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(fan_out, "TAG_CACHE_PATH", str(tmp_path / "tags.json"))
+    monkeypatch.setattr(fan_out, "ACCOUNT_CACHE_PATH", str(tmp_path / "accounts.json"))
+
+
+def test_consolidated_reports_match_a_combined_run(caches):
+    merged = FanOut(
+        plan,
+        accounts=ACCOUNTS,
+        sts=LocalSTS(),
+        clients=clients,
+        costexplorer=CostExplorer(client=object()),
+    ).run()
+    sts = LocalSTS()
+    payers = [
+        clients(sts.assume_role(RoleArn=arn, RoleSessionName="test")["Credentials"])[0]
+        for arn in ("arn:aws:iam::{}:role/r".format(a) for a in ACCOUNTS)
+    ]
+    combined = CostExplorer(client=CombinedCostExplorer(payers), cost_cache=False)
+    combined.keep_frames = True
+    plan(combined)
+    combined.run_planned_reports()
+
+    reports = {report["Name"]: report for report in merged.reports}
+    for expected in combined.reports:
+        # The summed frame before Style and TopN, for the Parquet history
+        pd.testing.assert_frame_equal(
+            reports[expected["Name"]]["Frame"], expected["Frame"], check_like=True
+        )
+        pd.testing.assert_frame_equal(
+            reports[expected["Name"]]["Data"], expected["Data"], check_names=False
+        )
+    assert "prod ServicesTotal" in reports and "labs ServicesTotal" in reports
+    # The payers rank different groups first, the roll-up is not their union
+    prod = reports["prod ServicesTotal"]["Data"].index[:3]
+    labs = reports["labs ServicesTotal"]["Data"].index[:3]
+    assert set(prod) != set(labs)
+
+
+def test_long_payer_names_get_unique_sheets(caches):
+    accounts = {
+        "111111111111": "production-payer-north-america",
+        "222222222222": "production-payer-north-america-2",
+    }
+    merged = FanOut(
+        plan,
+        accounts=accounts,
+        sts=LocalSTS(),
+        clients=clients,
+        costexplorer=CostExplorer(client=object()),
+    ).run()
+    names = [report["Name"] for report in merged.reports]
+
+    assert all(len(name) <= 31 for name in names)
+    assert len(set(name.lower() for name in names)) == len(names)
+    merged.generate_excel(Output=io.BytesIO())
+
+
+def test_payer_names_must_fit_sheet_names():
+    with pytest.raises(ValueError):
+        parse_accounts("111111111111=prod/eu")
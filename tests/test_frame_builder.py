@@ -0,0 +1,43 @@
+from change_styles import apply_style
+from conftest import result
+from frame_builder import CostFrameBuilder
+
+
+def test_period_split_across_pages():
+    builder = CostFrameBuilder(["UnblendedCost"], rows=2)
+    for page in (
+        result("2026-09-30", [("a", 1.0), ("b", 2.0), ("c", 3.0)]),
+        result("2026-10-01", [("a", 2.0), ("b", 4.0)]),
+        result("2026-10-01", [("c", 6.0)]),
+        result("2026-10-02", [("a", 3.0), ("b", 6.0), ("c", 9.0)]),
+    ):
+        builder.add(page)
+    df = builder.frame()
+
+    assert list(df.index) == ["2026-09-30", "2026-10-01", "2026-10-02"]
+    assert df.loc["2026-10-01"].tolist() == [2.0, 4.0, 6.0]
+    change = apply_style(df, "Change")
+    assert change.loc["2026-10-01"].tolist() == [1.0, 2.0, 3.0]
+    assert change.loc["2026-10-02"].tolist() == [1.0, 2.0, 3.0]
+
+
+def test_metrics_share_rows_and_columns():
+    metrics = ["UnblendedCost", "UsageQuantity"]
+    builder = CostFrameBuilder(metrics, rows=1)
+    builder.add(result("2026-10-01", [("a", 1.0), ("b", 2.0)], metrics))
+    builder.add(result("2026-10-01", [("c", 3.0)], metrics))
+
+    assert builder.frame("UnblendedCost").loc["2026-10-01"].tolist() == [1, 2, 3]
+    assert builder.frame("UsageQuantity").loc["2026-10-01"].tolist() == [2, 4, 6]
+
+
+def test_fold_within_a_result_goes_by_its_amounts():
+    builder = CostFrameBuilder(["UnblendedCost"], rows=1, max_groups=4)
+    groups = [("a", 1.0), ("b", 2.0), ("big", 100.0), ("c", 3.0), ("d", 4.0)]
+    builder.add(result("2026-10-01", groups))
+    builder.add(result("2026-10-02", [(str(i), float(i)) for i in range(10)]))
+    df = builder.frame()
+
+    assert df.loc["2026-10-01", "big"] == 100.0
+    assert "Other" in df.columns and len(df.columns) <= 4 + 1
+    assert df.to_numpy().sum() == 110.0 + sum(range(10))
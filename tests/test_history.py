@@ -0,0 +1,72 @@
+import datetime
+
+import pandas as pd
+
+from history import History
+
+PARAMS = {
+    "TimePeriod": {"Start": "2024-10-01", "End": "2024-10-06"},
+    "Granularity": "DAILY",
+    "Metrics": ["UnblendedCost"],
+}
+
+
+def frame(dates, **groups):
+    df = pd.DataFrame(groups, index=pd.Index(dates, name="date"))
+    return df.astype(float)
+
+
+def days(start, n):
+    first = datetime.date.fromisoformat(start)
+    return [(first + datetime.timedelta(days=i)).isoformat() for i in range(n)]
+
+
+def test_fetch_params_start_at_the_first_missing_period():
+    history = History(directory=None)
+    archived = frame(days("2024-10-01", 3), ec2=[1, 2, 3])
+    fetch = history.fetch_params(PARAMS, [archived])
+    assert fetch["TimePeriod"] == {"Start": "2024-10-04", "End": "2024-10-06"}
+    assert PARAMS["TimePeriod"]["Start"] == "2024-10-01"
+
+
+def test_fetch_params_go_by_the_archive_missing_most():
+    history = History(directory=None)
+    cost = frame(days("2024-10-01", 5), ec2=[1] * 5)
+    usage = frame(["2024-10-01", "2024-10-03"], ec2=[1, 1])
+    fetch = history.fetch_params(PARAMS, [cost, usage])
+    assert fetch["TimePeriod"]["Start"] == "2024-10-02"
+    # Without an archive the whole window is fetched
+    assert history.fetch_params(PARAMS, [None])["TimePeriod"]["Start"] == ("2024-10-01")
+
+
+def test_last_period_is_always_fetched():
+    history = History(directory=None)
+    archived = frame(days("2024-10-01", 5), ec2=[1] * 5)
+    fetch = history.fetch_params(PARAMS, [archived])
+    assert fetch["TimePeriod"]["Start"] == "2024-10-05"
+
+
+def test_extend_merges_archived_and_fetched_periods(tmp_path):
+    history = History(directory=str(tmp_path), mutable_days=0)
+    # One period before the window, 2024-10-03 fetched again
+    archived = frame(days("2024-09-30", 4), ec2=[9, 1, 2, 30])
+    fetched = frame(days("2024-10-03", 3), ec2=[3, 4, 5], s3=[1, 1, 1])
+    df = history.extend(PARAMS, "UnblendedCost", archived, fetched)
+    assert list(df.index) == days("2024-10-01", 5)
+    assert df["ec2"].tolist() == [1, 2, 3, 4, 5]
+    assert df["s3"].tolist() == [0, 0, 1, 1, 1]
+
+    # The archive keeps periods outside the window too
+    saved = History(directory=str(tmp_path)).load(PARAMS, "UnblendedCost")
+    assert list(saved.index) == days("2024-09-30", 6)
+    assert saved["ec2"].tolist() == [9, 1, 2, 3, 4, 5]
+
+
+def test_extend_archives_finalized_periods_only(tmp_path):
+    history = History(directory=str(tmp_path), mutable_days=3)
+    today = datetime.date.today()
+    dates = [(today - datetime.timedelta(days=i)).isoformat() for i in (5, 1)]
+    params = dict(PARAMS, TimePeriod={"Start": dates[0], "End": today.isoformat()})
+    history.extend(params, "UnblendedCost", None, frame(dates, ec2=[1, 2]))
+    saved = History(directory=str(tmp_path)).load(params, "UnblendedCost")
+    assert list(saved.index) == dates[:1]
@@ -0,0 +1,45 @@
+from paginator import iter_results, paginate
+
+
+class StubClient:
+    """get_cost_and_usage returning one result per page over several pages"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def get_cost_and_usage(self, **kwargs):
+        self.calls.append(kwargs)
+        page = len(self.calls) - 1
+        response = {"ResultsByTime": [{"Page": page}]}
+        if page + 1 < self.pages:
+            response["NextPageToken"] = "token-{}".format(page + 1)
+        return response
+
+
+PARAMS = {"TimePeriod": {"Start": "2026-10-01", "End": "2026-10-04"}}
+
+
+def test_every_page_is_read_with_the_original_parameters():
+    client = StubClient(pages=3)
+    results = list(iter_results(client, "get_cost_and_usage", PARAMS))
+    assert results == [{"Page": 0}, {"Page": 1}, {"Page": 2}]
+    assert client.calls == [
+        PARAMS,
+        dict(PARAMS, NextPageToken="token-1"),
+        dict(PARAMS, NextPageToken="token-2"),
+    ]
+    # The caller's parameters are left alone
+    assert "NextPageToken" not in PARAMS
+
+
+def test_requests_go_through_call():
+    client = StubClient(pages=2)
+    calls = []
+
+    def call(fn, **kwargs):
+        calls.append(kwargs)
+        return fn(**kwargs)
+
+    assert len(list(paginate(client, "get_cost_and_usage", PARAMS, call=call))) == 2
+    assert calls == client.calls
@@ -0,0 +1,59 @@
+import pytest
+
+from query_planner import QueryPlanner
+
+
+def fetcher(calls, results):
+    def fetch():
+        calls.append(1)
+        return iter(results)
+
+    return fetch
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_shared_results_dropped_after_last_report(max_workers):
+    planner = QueryPlanner(max_workers=max_workers)
+    calls, derived = [], []
+    planner.register("a", fetcher(calls, [1, 2]), lambda r: derived.append(list(r)))
+    planner.register("a", fetcher(calls, [1, 2]), lambda r: derived.append(list(r)))
+    planner.register("b", fetcher(calls, [3]), lambda r: derived.append(list(r)))
+    planner.execute()
+    assert derived == [[1, 2], [1, 2], [3]]
+    assert len(calls) == planner.queries_run == 2
+    assert planner.results == {}
+
+
+def test_keep_results_reuses_queries_between_executions():
+    planner = QueryPlanner(keep_results=True)
+    calls, derived = [], []
+    planner.register("a", fetcher(calls, [1]), lambda r: derived.append(list(r)))
+    planner.execute()
+    planner.register("a", fetcher(calls, [1]), lambda r: derived.append(list(r)))
+    planner.execute()
+    assert derived == [[1], [1]]
+    assert len(calls) == 1
+
+
+def test_single_report_queries_stream_from_the_pool():
+    planner = QueryPlanner(max_workers=2)
+    derived = []
+    planner.register("a", lambda: iter([1, 2]), lambda r: derived.append(r))
+    planner.register("b", lambda: iter([3]), lambda r: derived.append(list(r)))
+    planner.execute()
+    # A generator rather than a list held by the planner
+    assert not isinstance(derived[0], list)
+    assert derived[1] == [3]
+    assert planner.results == {}
+
+
+def test_streamed_query_failure_reaches_the_report():
+    def fail():
+        yield 1
+        raise ValueError("boom")
+
+    planner = QueryPlanner(max_workers=2)
+    planner.register("a", fail, lambda r: list(r))
+    planner.register("b", lambda: iter([3]), lambda r: list(r))
+    with pytest.raises(ValueError):
+        planner.execute()
@@ -0,0 +1,89 @@
+import datetime
+import threading
+import time
+
+import psycopg2.extensions
+import psycopg2.pool
+import pytest
+
+import rds_access
+
+
+class Connection:
+    def __init__(self):
+        self.closed = 0
+        self.info = type(
+            "Info",
+            (),
+            {"transaction_status": psycopg2.extensions.TRANSACTION_STATUS_IDLE},
+        )()
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(psycopg2.pool.psycopg2, "connect", lambda *a, **k: Connection())
+    secret = {"dbname": "db", "username": "u", "password": "p", "host": "h"}
+    monkeypatch.setattr(rds_access, "get_config", lambda refresh=False: secret)
+    monkeypatch.setattr(rds_access, "is_healthy", lambda conn: True)
+    monkeypatch.setattr(rds_access, "_pool", None)
+    yield
+    rds_access._pool = None
+
+
+def test_refresh_keeps_connections_in_use_open(pool):
+    with rds_access.get_connection() as streaming:
+        old = rds_access._pool
+        idle = old.getconn()
+        old.putconn(idle)
+        # Another thread retries with a refreshed pool meanwhile
+        with rds_access.get_connection(refresh=True) as retry:
+            assert rds_access._pool is not old
+            assert retry is not streaming
+        assert not streaming.closed
+        assert not old.closed
+    # The old pool closes once its last borrowed connection is back
+    assert streaming.closed
+    assert idle.closed
+    assert old.closed
+
+
+def test_borrowing_waits_for_a_free_connection(pool, monkeypatch):
+    monkeypatch.setattr(rds_access, "POOL_MAX_CONNECTIONS", 1)
+    borrowed = threading.Event()
+    returned = []
+
+    def borrow():
+        with rds_access.get_connection():
+            borrowed.set()
+            time.sleep(0.1)
+            returned.append(time.monotonic())
+
+    thread = threading.Thread(target=borrow)
+    thread.start()
+    borrowed.wait()
+    with rds_access.get_connection():
+        # Not PoolError, the connection of the other thread is free again
+        assert returned and time.monotonic() >= returned[0]
+    thread.join()
+
+
+def test_tranches_are_counted_in_one_query(monkeypatch):
+    old = datetime.date.today() - datetime.timedelta(days=30)
+    new = datetime.date.today()
+    queries = []
+
+    def run_query(sql, substitutions=None, read_only=True):
+        queries.append(substitutions["tranche_dates"])
+        return [(old, 10)]
+
+    monkeypatch.setattr(rds_access, "run_query", run_query)
+    assert rds_access.get_dogs_per_tranche([old, new]) == {
+        old.isoformat(): 10,
+        new.isoformat(): None,
+    }
+    assert queries == [[old, new]]
+    assert rds_access.get_dogs_per_tranche([]) == {}
+    assert len(queries) == 1
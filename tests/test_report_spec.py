@@ -0,0 +1,62 @@
+import pytest
+
+from cost_explorer_report import CostExplorer
+from report_spec import DryRunClient, estimate, validate_spec
+from tag_cache import TAG_FILTER_BATCH_SIZE
+
+
+def errors(report):
+    with pytest.raises(ValueError) as error:
+        validate_spec({"Reports": [dict({"Name": "Services"}, **report)]})
+    return str(error.value)
+
+
+def test_valid_spec():
+    validate_spec(
+        {
+            "Reports": [
+                {
+                    "Name": "ServicesMetrics",
+                    "GroupBy": [{"Type": "DIMENSION", "Key": "SERVICE"}],
+                    "Metrics": ["UnblendedCost", "UsageQuantity"],
+                },
+                {"Type": "cube", "Dimensions": ["SERVICE", "REGION"]},
+            ]
+        }
+    )
+
+
+def test_group_by_must_be_a_list():
+    assert "GroupBy must be a list" in errors({"GroupBy": None})
+
+
+def test_group_by_has_at_most_two_keys():
+    group_by = [{"Type": "DIMENSION", "Key": key} for key in ("A", "B", "C")]
+    assert "at most 2" in errors({"GroupBy": group_by})
+
+
+def test_metrics_must_be_a_list():
+    assert "Metrics must be a non empty list" in errors({"Metrics": "UnblendedCost"})
+
+
+def test_ri_report_names_are_checked():
+    assert "unknown RI report Name RICoverge" in errors(
+        {"Type": "ri", "Name": "RICoverge"}
+    )
+
+
+def test_plan_ri_report_rejects_unknown_names():
+    costexplorer = CostExplorer(client=DryRunClient(), cost_cache=False)
+    with pytest.raises(ValueError):
+        costexplorer.plan_ri_report(Name="RICoverge")
+
+
+def test_estimate_counts_tag_filter_batches():
+    spec = {
+        "Settings": {"TagKey": "team"},
+        "Reports": [{"Name": "Services"}],
+    }
+    assert not estimate(spec)["TagBatchesEstimated"]
+    result = estimate(spec, tag_values=TAG_FILTER_BATCH_SIZE * 2 + 1)
+    assert result["TagBatchesEstimated"]
+    assert result["Queries"][0]["Pages"] == 3
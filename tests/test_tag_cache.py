@@ -0,0 +1,24 @@
+import datetime
+
+from tag_cache import TagValueResolver
+
+
+def test_values_are_cached_per_window(tmp_path):
+    requests = []
+
+    def fetch(params):
+        requests.append(params["TimePeriod"])
+        return iter(["team-{}".format(len(requests))])
+
+    path = str(tmp_path / "tag_values.json")
+    end = datetime.date(2026, 10, 18)
+    week = end - datetime.timedelta(days=7)
+    month = datetime.date(2026, 9, 1)
+
+    assert TagValueResolver(fetch, path=path).values("team", "*", week, end) == [
+        "team-1"
+    ]
+    tags = TagValueResolver(fetch, path=path)
+    assert tags.values("team", "*", week, end) == ["team-1"]
+    assert tags.values("team", "*", month, end) == ["team-2"]
+    assert len(requests) == 2
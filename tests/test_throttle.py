@@ -0,0 +1,52 @@
+import pytest
+from botocore.exceptions import ClientError
+
+import throttle
+from throttle import Throttle
+
+
+def error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "GetCostAndUsage")
+
+
+def flaky(*codes):
+    """Raises a ClientError for each code in turn, then returns the kwargs"""
+    calls = []
+
+    def fn(**kwargs):
+        calls.append(kwargs)
+        if len(calls) <= len(codes):
+            raise error(codes[len(calls) - 1])
+        return kwargs
+
+    return fn, calls
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(throttle.time, "sleep", lambda seconds: None)
+
+
+@pytest.mark.parametrize("code", throttle.THROTTLING_ERRORS)
+def test_retries_throttling_errors(code):
+    fn, calls = flaky(code, code)
+    limiter = Throttle(rate=1000, max_retries=3)
+    assert limiter.call(fn, Granularity="DAILY") == {"Granularity": "DAILY"}
+    assert calls == [{"Granularity": "DAILY"}] * 3
+    # Backed off, then recovering
+    assert limiter.rate < limiter.max_rate
+
+
+def test_gives_up_after_max_retries():
+    fn, calls = flaky(*["ThrottlingException"] * 3)
+    with pytest.raises(ClientError):
+        Throttle(rate=1000, max_retries=2).call(fn)
+    assert len(calls) == 3
+
+
+def test_reraises_other_errors():
+    fn, calls = flaky("AccessDeniedException")
+    with pytest.raises(ClientError) as raised:
+        Throttle(rate=1000, max_retries=3).call(fn)
+    assert raised.value.response["Error"]["Code"] == "AccessDeniedException"
+    assert len(calls) == 1
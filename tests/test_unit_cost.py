@@ -0,0 +1,48 @@
+import math
+
+import pandas as pd
+
+from unit_cost import daily_units, unit_cost
+
+
+def report():
+    """Cost report of two groups over three days, with a total column"""
+    return pd.DataFrame(
+        [[10.0, 20.0, 30.0, 60.0], [2.0, 4.0, 6.0, 12.0]],
+        index=pd.Index(["ec2", "s3"], name="group"),
+        columns=["2026-10-01", "2026-10-02", "2026-10-03", "total"],
+    )
+
+
+def test_days_without_volume_are_left_out():
+    # 2026-10-02 has no volume, 2026-10-03 a zero one
+    units = pd.Series({"2026-10-01": 5.0, "2026-10-03": 0.0})
+    df = unit_cost(report(), units, "n_dogs")
+    assert list(df.columns) == ["2026-10-01", "total"]
+    assert df.loc["n_dogs"].tolist() == [5.0, 5.0]
+    assert df.loc["ec2", "2026-10-01"] == 2.0
+    # The cost of days without volume still counts in the total
+    assert df.loc["ec2", "total"] == 60.0 / 5.0
+    assert df.loc["s3", "total"] == 12.0 / 5.0
+
+
+def test_total_is_total_cost_over_total_volume():
+    units = pd.Series({"2026-10-01": 1.0, "2026-10-02": 2.0, "2026-10-03": 5.0})
+    df = unit_cost(report(), units, "n_dogs")
+    # Not the mean of the daily unit costs (10, 10, 6)
+    assert df.loc["ec2"].tolist() == [10.0, 10.0, 6.0, 7.5]
+    assert df.loc["n_dogs", "total"] == 8.0
+    assert df.loc["s3", "total"] == 12.0 / 8.0
+
+
+def test_no_volume_at_all():
+    df = unit_cost(report(), pd.Series(dtype=float), "n_dogs")
+    assert list(df.columns) == ["total"]
+    assert math.isnan(df.loc["ec2", "total"])
+
+
+def test_daily_units_sums_rows_of_a_date():
+    df = pd.DataFrame(
+        {"n_dogs": [2, 3, 4]}, index=["2026-10-01", "2026-10-01", "2026-10-02"]
+    )
+    assert daily_units(df, "n_dogs").to_dict() == {"2026-10-01": 5.0, "2026-10-02": 4.0}